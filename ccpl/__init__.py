@@ -0,0 +1,5 @@
+"""Helpers for the Copy Cut and Paste Lines commands.
+
+Modules in this package are imported on demand by main.py, so they are not
+loaded by Sublime Text at startup.
+"""
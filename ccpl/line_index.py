@@ -0,0 +1,369 @@
+"""An index of the lines in a view, used for row/column math on many regions.
+
+The index records where each line starts, and optionally whether each line is
+blank and how far it is indented, for expanding selections to blocks of lines.
+It is built in a single pass over the buffer and cached against
+view.change_count(), so handling thousands of cursors only scans the buffer
+once. Only the latest index is kept, since an index of a huge buffer is large,
+and editing the buffer makes it stale anyway.
+
+If NumPy is available, newlines are found with a vectorized scan and rows are
+looked up with searchsorted. Otherwise, the same results are calculated in pure
+Python.
+"""
+
+import bisect
+
+import sublime
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Expansion modes supported by LineIndex.expand.
+LINE = 'line'
+PARAGRAPH = 'paragraph'
+INDENTATION = 'indentation'
+MODES = (LINE, PARAGRAPH, INDENTATION)
+
+# The buffer is read this many characters at a time, so that a huge buffer is
+# never copied all at once.
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# (view id, LineIndex) of the view that was indexed last, or None.
+_cached_index = None
+
+
+def get_line_index(view, blocks=False):
+    """Returns the LineIndex for view, rebuilding it if the buffer has changed.
+
+    blocks: Whether blank lines and indentation are needed, for expanding to
+            paragraphs or indentation blocks.
+    """
+    global _cached_index
+    change_count = view.change_count()
+    line_index = None
+    if _cached_index is not None:
+        view_id, line_index = _cached_index
+        if view_id != view.id() or line_index.change_count != change_count:
+            line_index = None
+    # Let go of a stale index before building the new one.
+    _cached_index = None
+    if line_index is None:
+        def read(begin, end):
+            return view.substr(sublime.Region(begin, end))
+        line_index = LineIndex(read, view.size(), change_count)
+    if blocks:
+        line_index.index_blocks()
+    _cached_index = (view.id(), line_index)
+    return line_index
+
+
+def discard_line_index(view):
+    """Drops the cached LineIndex for view, if there is one.
+
+    Call once a command is done with the index, so it doesn't stay in memory
+    after the next edit makes it stale.
+    """
+    global _cached_index
+    if _cached_index is not None and _cached_index[0] == view.id():
+        _cached_index = None
+
+
+def find_line_starts(text, offset=0, use_numpy=True):
+    """Returns offset plus the position after each newline in text.
+
+    Returns a NumPy array if use_numpy is true and NumPy is available, or a
+    list otherwise.
+    """
+    if use_numpy and numpy is not None:
+        # Positions in the view count characters, so use a fixed-width encoding.
+        try:
+            data = numpy.frombuffer(text.encode('latin-1'), dtype=numpy.uint8)
+        except UnicodeEncodeError:
+            data = numpy.frombuffer(text.encode('utf-32-le'), dtype=numpy.uint32)
+        return numpy.flatnonzero(data == 10) + (offset + 1)
+    line_starts = []
+    start = offset
+    for line in text.split('\n')[:-1]:
+        start += len(line) + 1
+        line_starts.append(start)
+    return line_starts
+
+
+def is_box(begins, ends, row_begins, row_ends):
+    """Returns whether regions on consecutive rows form a box selection.
+
+    A box has one region on each of two or more consecutive rows, all spanning
+    the same columns. Regions on rows that are too short to reach the box's
+    columns are cut off at the end of the row. Regions covering whole rows
+    aren't considered a box, since they are really full lines.
+    begins, ends: The begin and end of each region.
+    row_begins, row_ends: The begin and end of the row each region is on.
+    All four may be NumPy arrays instead of lists.
+    """
+    if numpy is not None and isinstance(begins, numpy.ndarray):
+        if (begins < row_begins).any() or (ends > row_ends).any():
+            return False
+        begin_columns = begins - row_begins
+        end_columns = ends - row_begins
+        row_lengths = row_ends - row_begins
+        # The box's columns are those of the first region reaching furthest.
+        box_row = int(numpy.argmax(end_columns))
+        box_begin = begin_columns[box_row]
+        box_end = end_columns[box_row]
+        if box_begin == box_end:
+            return False
+        if ((begin_columns == 0) & (end_columns == row_lengths)).all():
+            return False
+        return bool((((end_columns == box_end) | (end_columns == row_lengths)) &
+                     ((begin_columns == box_begin) | (begin_columns == row_lengths))).all())
+    box_begin = box_end = 0
+    columns = []
+    whole_rows = True
+    for begin, end, row_begin, row_end in zip(begins, ends, row_begins, row_ends):
+        if begin < row_begin or end > row_end:
+            return False
+        begin_column = begin - row_begin
+        end_column = end - row_begin
+        row_length = row_end - row_begin
+        if end_column > box_end:
+            box_begin = begin_column
+            box_end = end_column
+        whole_rows = whole_rows and begin_column == 0 and end_column == row_length
+        columns.append((begin_column, end_column, row_length))
+    if box_begin == box_end or whole_rows:
+        return False
+    for begin_column, end_column, row_length in columns:
+        if end_column != box_end and end_column != row_length:
+            return False
+        if begin_column != box_begin and begin_column != row_length:
+            return False
+    return True
+
+
+class LineIndex:
+    """Line starts, blank lines, and indentation levels of a buffer.
+
+    Rows are numbered from 0, the same as view.rowcol().
+    read: Called as read(begin, end) to get the text of the buffer.
+    size: The size of the buffer.
+    use_numpy: Whether to use NumPy if it is available.
+    begin: Where the indexed text starts, to index only the rows from there to
+           size. Rows are then numbered from begin, and points before it
+           can't be looked up.
+    """
+
+    def __init__(self, read, size, change_count=None, use_numpy=True, begin=0):
+        self.change_count = change_count
+        self.size = size
+        self._read = read
+        self._use_numpy = use_numpy and numpy is not None
+        chunks = [[begin]]
+        for chunk_begin in range(begin, size, CHUNK_SIZE):
+            text = read(chunk_begin, min(chunk_begin + CHUNK_SIZE, size))
+            chunks.append(find_line_starts(text, chunk_begin, self._use_numpy))
+        if self._use_numpy:
+            self.starts = numpy.concatenate(chunks).astype(numpy.int64)
+        else:
+            self.starts = [start for chunk in chunks for start in chunk]
+        # Blank lines and indentation are only found if a mode needs them.
+        self.blank = None
+        self.indents = None
+        self._paragraph_bounds = None
+        self._indentation_bounds = None
+
+    def index_blocks(self):
+        """Finds which lines are blank and how far each line is indented."""
+        if self.blank is not None:
+            return
+        self.blank = []
+        self.indents = []
+        row_count = len(self.starts)
+        first_row = 0
+        while first_row < row_count:
+            # Read whole lines, about CHUNK_SIZE characters at a time.
+            end_row = self.row(int(self.starts[first_row]) + CHUNK_SIZE) + 1
+            end_row = max(end_row, first_row + 1)
+            text = self._read(int(self.starts[first_row]),
+                              self.line_end(end_row - 1))
+            for line in text.split('\n'):
+                stripped_line = line.lstrip()
+                self.blank.append(stripped_line == '')
+                self.indents.append(len(line) - len(stripped_line))
+            first_row = end_row
+
+    def row(self, point):
+        """Returns the row containing point."""
+        if self._use_numpy:
+            return int(numpy.searchsorted(self.starts, point, side='right')) - 1
+        return bisect.bisect_right(self.starts, point) - 1
+
+    def rowcols(self, points):
+        """Returns lists of the (rows, columns) of points.
+
+        Same as calling view.rowcol for each point, but all at once.
+        """
+        if self._use_numpy:
+            points = numpy.asarray(points, dtype=numpy.int64)
+            rows = numpy.searchsorted(self.starts, points, side='right') - 1
+            return rows.tolist(), (points - self.starts[rows]).tolist()
+        starts = self.starts
+        rows = [bisect.bisect_right(starts, point) - 1 for point in points]
+        columns = [point - starts[row] for point, row in zip(points, rows)]
+        return rows, columns
+
+    def line_end(self, row):
+        """Returns the end of row, not including its newline."""
+        if row + 1 < len(self.starts):
+            return int(self.starts[row + 1]) - 1
+        return self.size
+
+    def full_line_end(self, row):
+        """Returns the end of row, including its newline."""
+        if row + 1 < len(self.starts):
+            return int(self.starts[row + 1])
+        return self.size
+
+    def full_lines(self, regions):
+        """Returns (begin, end) of the full lines containing each region.
+
+        Same as calling view.full_line for each region, but all at once.
+        """
+        begins = [region.begin() for region in regions]
+        ends = [region.end() for region in regions]
+        if self._use_numpy:
+            row_count = len(self.starts)
+            first_rows = numpy.searchsorted(self.starts, begins, side='right') - 1
+            next_rows = numpy.searchsorted(self.starts, ends, side='right')
+            line_ends = self.starts[numpy.minimum(next_rows, row_count - 1)]
+            # The last line ends at the end of the buffer.
+            line_ends[next_rows == row_count] = self.size
+            return list(zip(self.starts[first_rows].tolist(), line_ends.tolist()))
+        return [(self.starts[self.row(begin)], self.full_line_end(self.row(end)))
+                for begin, end in zip(begins, ends)]
+
+    def is_box(self, regions):
+        """Returns whether the sorted regions form a box (rectangular) selection.
+
+        Same as the is_box function, with each region on the row after the
+        previous one.
+        """
+        # Work out the row of the first region only. Every other region must be
+        # on the row after the previous one.
+        first_row = self.row(regions[0].begin())
+        end_row = first_row + len(regions)
+        if end_row > len(self.starts):
+            return False
+        row_begins = self.starts[first_row:end_row]
+        if self._use_numpy:
+            # Reading the attributes is faster than calling begin() and end().
+            a = numpy.array([region.a for region in regions], dtype=numpy.int64)
+            b = numpy.array([region.b for region in regions], dtype=numpy.int64)
+            row_ends = numpy.append(self.starts[first_row + 1:end_row] - 1,
+                                    self.line_end(end_row - 1))
+            return is_box(numpy.minimum(a, b), numpy.maximum(a, b),
+                          row_begins, row_ends)
+        begins = [region.begin() for region in regions]
+        ends = [region.end() for region in regions]
+        row_ends = [start - 1 for start in row_begins[1:]]
+        row_ends.append(self.line_end(end_row - 1))
+        return is_box(begins, ends, row_begins, row_ends)
+
+    def expand(self, begin, end, mode):
+        """Returns (begin, end) of the blocks containing the region begin-end.
+
+        mode is one of:
+            LINE: The full lines containing the region.
+            PARAGRAPH: The blank-line delimited paragraphs containing the region.
+            INDENTATION: The indentation blocks containing the region.
+        Blank lines expand to the run of blank lines around them.
+        """
+        if mode != LINE and self.blank is None:
+            raise ValueError('Call index_blocks() before expanding to blocks')
+        if mode == LINE:
+            bounds = None
+        elif mode == PARAGRAPH:
+            bounds = self._get_paragraph_bounds()
+        elif mode == INDENTATION:
+            bounds = self._get_indentation_bounds()
+        else:
+            raise ValueError('Unknown expansion mode: {!r}'.format(mode))
+        first_row = self.row(begin)
+        last_row = self.row(end)
+        if bounds is not None:
+            first_rows, last_rows = bounds
+            first_row, last_row = (
+                min(first_rows[first_row], first_rows[last_row]),
+                max(last_rows[first_row], last_rows[last_row]))
+        return int(self.starts[first_row]), self.full_line_end(last_row)
+
+    def _get_blank_runs(self):
+        """Returns (first_rows, last_rows) of the runs of blank/non-blank lines."""
+        row_count = len(self.starts)
+        first_rows = [0] * row_count
+        last_rows = [0] * row_count
+        for row in range(1, row_count):
+            if self.blank[row] == self.blank[row - 1]:
+                first_rows[row] = first_rows[row - 1]
+            else:
+                first_rows[row] = row
+        last_rows[-1] = row_count - 1
+        for row in range(row_count - 2, -1, -1):
+            if self.blank[row] == self.blank[row + 1]:
+                last_rows[row] = last_rows[row + 1]
+            else:
+                last_rows[row] = row
+        return first_rows, last_rows
+
+    def _get_paragraph_bounds(self):
+        """Returns (first_rows, last_rows) of the paragraph containing each row."""
+        if self._paragraph_bounds is None:
+            self._paragraph_bounds = self._get_blank_runs()
+        return self._paragraph_bounds
+
+    def _get_indentation_bounds(self):
+        """Returns (first_rows, last_rows) of the indentation block of each row.
+
+        The block of a line is the surrounding lines that are indented at least
+        as far as it is, not counting blank lines at either end.
+        """
+        if self._indentation_bounds is not None:
+            return self._indentation_bounds
+        # Blank lines don't end a block, so start from the blank-line runs.
+        first_rows, last_rows = self._get_blank_runs()
+        first_rows = list(first_rows)
+        last_rows = list(last_rows)
+        row_count = len(self.starts)
+        # The nearest non-blank line at or after/before each row.
+        next_filled_rows = [row_count] * (row_count + 1)
+        for row in range(row_count - 1, -1, -1):
+            next_filled_rows[row] = row if not self.blank[row] else next_filled_rows[row + 1]
+        previous_filled_rows = [-1] * row_count
+        for row in range(row_count):
+            if not self.blank[row]:
+                previous_filled_rows[row] = row
+            elif row > 0:
+                previous_filled_rows[row] = previous_filled_rows[row - 1]
+        # Find the nearest less-indented line on each side using a stack of
+        # rows with strictly increasing indentation.
+        stack = []
+        for row in range(row_count):
+            if self.blank[row]:
+                continue
+            while stack and self.indents[stack[-1]] >= self.indents[row]:
+                stack.pop()
+            first_rows[row] = next_filled_rows[stack[-1] + 1] if stack else next_filled_rows[0]
+            stack.append(row)
+        stack = []
+        for row in range(row_count - 1, -1, -1):
+            if self.blank[row]:
+                continue
+            while stack and self.indents[stack[-1]] >= self.indents[row]:
+                stack.pop()
+            last_rows[row] = previous_filled_rows[stack[-1] - 1] if stack else previous_filled_rows[-1]
+            stack.append(row)
+        self._indentation_bounds = first_rows, last_rows
+        return self._indentation_bounds
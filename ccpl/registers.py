@@ -0,0 +1,191 @@
+"""Named line registers, kept in an append-only file so they survive restarts.
+
+Each record in the file is a header line followed by the register's text:
+    <length of text in bytes> <register name>\n<text>
+Setting a register appends a new record, and the index maps each name to its
+latest record. The index is only read from disk the first time a register is
+used, and stale records are dropped by compact(), which is scheduled in the
+background once they take up enough of the file.
+"""
+
+import os
+import threading
+
+
+# Compact when the file is at least this big and mostly stale records.
+COMPACT_MIN_SIZE = 1024 * 1024
+COMPACT_MIN_STALE_RATIO = 0.5
+
+
+class RegisterStore:
+    """Registers stored in the file at path.
+
+    schedule: Called with a function to run it in the background, e.g.
+              sublime.set_timeout_async. If None, the file is never compacted
+              automatically.
+    """
+
+    def __init__(self, path, schedule=None):
+        self.path = path
+        self._schedule = schedule
+        # Guards the index and appends to the file.
+        self._lock = threading.Lock()
+        # Stops two compactions from writing the temporary file at once.
+        self._compact_lock = threading.Lock()
+        # Maps name -> (record offset, text offset, text length).
+        self._index = None
+        self._file_size = 0
+        self._live_size = 0
+        self._compact_scheduled = False
+
+    def get(self, name):
+        """Returns the text in the register, or None if it is empty."""
+        with self._lock:
+            record = self._get_index().get(name)
+            if record is None:
+                return None
+            record_offset, text_offset, text_length = record
+            with open(self.path, 'rb') as register_file:
+                register_file.seek(text_offset)
+                return register_file.read(text_length).decode('utf-8')
+
+    def set(self, name, text):
+        """Stores text in the register."""
+        if not name or '\n' in name:
+            raise ValueError('Invalid register name: {!r}'.format(name))
+        data = text.encode('utf-8')
+        header = '{} {}\n'.format(len(data), name).encode('utf-8')
+        with self._lock:
+            index = self._get_index()
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'ab') as register_file:
+                register_file.write(header + data)
+            old_record = index.get(name)
+            if old_record is not None:
+                self._live_size -= self._record_size(old_record)
+            record = (self._file_size, self._file_size + len(header), len(data))
+            index[name] = record
+            self._file_size += len(header) + len(data)
+            self._live_size += len(header) + len(data)
+            compact = self._should_compact()
+        if compact:
+            self._schedule(self.compact)
+
+    def names(self):
+        """Returns the names of all non-empty registers."""
+        with self._lock:
+            return sorted(self._get_index())
+
+    def compact(self):
+        """Rewrites the file without the stale records.
+
+        The live records are copied without holding the lock, so registers can
+        still be used meanwhile. Records appended during the copy are added on
+        the end before the new file replaces the old one.
+        """
+        with self._compact_lock:
+            temporary_path = self.path + '.tmp'
+            try:
+                with self._lock:
+                    index = dict(self._get_index())
+                    copied_size = self._file_size
+                new_index = {}
+                offset = 0
+                with open(self.path, 'rb') as old_file, \
+                        open(temporary_path, 'wb') as new_file:
+                    # Copy the records in file order, so reads are sequential.
+                    records = sorted(index.items(), key=lambda item: item[1])
+                    for name, record in records:
+                        record_offset, text_offset, text_length = record
+                        old_file.seek(record_offset)
+                        record_size = self._record_size(record)
+                        new_file.write(old_file.read(record_size))
+                        new_index[name] = (offset,
+                                           offset + text_offset - record_offset,
+                                           text_length)
+                        offset += record_size
+                with self._lock:
+                    if self._file_size > copied_size:
+                        # Copy the records appended meanwhile as they are.
+                        with open(self.path, 'rb') as old_file, \
+                                open(temporary_path, 'ab') as new_file:
+                            old_file.seek(copied_size)
+                            new_file.write(
+                                old_file.read(self._file_size - copied_size))
+                        shift = offset - copied_size
+                        for name, record in self._index.items():
+                            record_offset, text_offset, text_length = record
+                            if record_offset >= copied_size:
+                                new_index[name] = (record_offset + shift,
+                                                   text_offset + shift, text_length)
+                        offset += self._file_size - copied_size
+                    os.replace(temporary_path, self.path)
+                    self._index = new_index
+                    self._file_size = offset
+                    self._live_size = sum(self._record_size(record)
+                                          for record in new_index.values())
+            finally:
+                # Let compaction be scheduled again, even if this one failed.
+                with self._lock:
+                    self._compact_scheduled = False
+                if os.path.exists(temporary_path):
+                    os.remove(temporary_path)
+
+    @staticmethod
+    def _record_size(record):
+        record_offset, text_offset, text_length = record
+        return text_offset - record_offset + text_length
+
+    def _should_compact(self):
+        """Returns whether to schedule compaction. Call with the lock held."""
+        if self._schedule is None or self._compact_scheduled:
+            return False
+        if self._file_size < COMPACT_MIN_SIZE:
+            return False
+        stale_size = self._file_size - self._live_size
+        if stale_size < self._file_size * COMPACT_MIN_STALE_RATIO:
+            return False
+        self._compact_scheduled = True
+        return True
+
+    def _get_index(self):
+        """Returns the index, reading it from the file the first time.
+
+        Call with the lock held. Only the headers are read; the text of each
+        record is skipped over. An incomplete record at the end of the file,
+        e.g. from a crash while writing, is truncated.
+        """
+        if self._index is not None:
+            return self._index
+        index = {}
+        live_size = 0
+        offset = 0
+        if os.path.exists(self.path):
+            file_size = os.path.getsize(self.path)
+            with open(self.path, 'rb') as register_file:
+                while offset < file_size:
+                    header = register_file.readline()
+                    try:
+                        length, name = header.decode('utf-8').rstrip('\n').split(' ', 1)
+                        text_length = int(length)
+                    except ValueError:
+                        break
+                    text_offset = offset + len(header)
+                    if not header.endswith(b'\n') or text_offset + text_length > file_size:
+                        break
+                    old_record = index.get(name)
+                    if old_record is not None:
+                        live_size -= self._record_size(old_record)
+                    index[name] = (offset, text_offset, text_length)
+                    live_size += len(header) + text_length
+                    offset = text_offset + text_length
+                    register_file.seek(offset)
+            if offset < file_size:
+                with open(self.path, 'r+b') as register_file:
+                    register_file.truncate(offset)
+        self._index = index
+        self._file_size = offset
+        self._live_size = live_size
+        return index
@@ -1,13 +1,36 @@
 """Replacements for clipboard commands that prefer to operate on full lines of code.
 
 Replaces: Copy, Cut, Paste, and Duplicate Lines
-Note: For selections within a single line, commands work as normal, operating
-      only on the selection and not on the full line.
+Adds: Delete Lines, Move Lines Up/Down, Send Lines to View/Group,
+      Paste to Selected Views
+Note: For selections within a single line and box selections, commands work as
+      normal, operating only on the selection and not on the full line.
 """
 
+import functools
+import os
+import sys
+import time
 import sublime, sublime_plugin
 
 
+# The PasteText being sent to other views by CcplSendLinesToViewCommand or
+# CcplPasteToSelectedViewsCommand. It is handed over here instead of as a
+# command argument, so that large transfers don't need to be serialized.
+_lines_in_transit = None
+
+# The RegisterStore, created the first time a register is used.
+_register_store = None
+
+# With at least this many regions, rows and columns are found using an index of
+# the whole buffer, instead of asking the view about each region...
+LINE_INDEX_MIN_REGIONS = 1000
+# ...unless the buffer has more than this many characters per region. Building
+# the index reads the whole buffer, which costs more than asking the view when
+# the regions are spread thinly through a large buffer.
+LINE_INDEX_MAX_SIZE_PER_REGION = 1000
+
+
 class ExpandedRegion(sublime.Region):
     """Adds original_regions - the regions that were expanded into this."""
     def __init__(self, region, original_region=None):
@@ -19,47 +42,205 @@ class ExpandedRegion(sublime.Region):
             self.original_regions.append(original_region)
 
 
-def get_expanded_selection(view):
+def get_expanded_selection(view, mode='line'):
     """Returns the selection expanded to full lines.
 
+    mode can also be 'paragraph' or 'indentation', to expand to the
+    blank-line delimited paragraphs or indentation blocks containing the
+    selection instead.
     Returns a list of ExpandedRegion.
     """
-    if len(view.sel()) == 0:
+    selection = list(view.sel())
+    if len(selection) == 0:
         # Null selection
         return []
+    if mode == 'line' and not use_line_index(view, len(selection)):
+        expanded_regions = [view.full_line(region) for region in selection]
+    elif not use_line_index(view, len(selection)):
+        # Only read the lines around each region, instead of the whole buffer.
+        expanded_regions = [expand_to_block(view, region, mode)
+                            for region in selection]
+    else:
+        # Use an index of the buffer, so it's only scanned once.
+        from .ccpl.line_index import get_line_index
+        line_index = get_line_index(view, blocks=(mode != 'line'))
+        if mode == 'line':
+            expanded_regions = [sublime.Region(begin, end) for begin, end
+                                in line_index.full_lines(selection)]
+        else:
+            expanded_regions = [
+                sublime.Region(*line_index.expand(region.begin(), region.end(), mode))
+                for region in selection]
     expanded_selection = []
-    previous_expanded_region_end = -1
     # Expand all regions to the full lines containing them.
-    for region in view.sel():
-        expanded_region = ExpandedRegion(view.full_line(region), region)
-        if expanded_region.begin() < previous_expanded_region_end:
-            # Merge overlapping selections.
-            new_region = expanded_selection[-1].cover(expanded_region)
+    for region, expanded_line in zip(selection, expanded_regions):
+        expanded_region = ExpandedRegion(expanded_line, region)
+        # Merge overlapping selections. A block can cover more than one of the
+        # previous regions, so keep merging until there's no overlap.
+        while (expanded_selection and
+               expanded_region.begin() < expanded_selection[-1].end()):
+            previous_region = expanded_selection.pop()
+            new_region = previous_region.cover(expanded_region)
             # Don't use new_region directly or we'll lose original_regions.
-            expanded_selection[-1].a = new_region.a
-            expanded_selection[-1].b = new_region.b
-            # Append another original region.
-            expanded_selection[-1].original_regions.append(region)
-        else:
-            expanded_selection.append(expanded_region)
-        previous_expanded_region_end = expanded_region.end()
+            previous_region.a = new_region.a
+            previous_region.b = new_region.b
+            # Append the other original regions.
+            previous_region.original_regions.extend(
+                expanded_region.original_regions)
+            expanded_region = previous_region
+        expanded_selection.append(expanded_region)
     return expanded_selection
 
 
-def copy_selection_lines(selection, view):
-    """Copies the selection to the clipboard.
+def use_line_index(view, region_count):
+    """Returns whether to look up region_count regions using the line index."""
+    return (region_count >= LINE_INDEX_MIN_REGIONS and
+            view.size() <= region_count * LINE_INDEX_MAX_SIZE_PER_REGION)
+
+
+def expand_to_block(view, region, mode):
+    """Returns the paragraphs or indentation blocks containing region.
+
+    Same as LineIndex.expand, but found by walking outwards from the region one
+    line at a time.
+    """
+    lines = [view.line(region.begin()), view.line(region.end())]
+    if lines[0] == lines[1]:
+        lines.pop()
+    bounds = [get_block_bounds(view, line, mode) for line in lines]
+    begin = min(first_line.begin() for first_line, last_line in bounds)
+    end = max(last_line.end() for first_line, last_line in bounds)
+    return sublime.Region(begin, view.full_line(end).end())
+
+
+def get_block_bounds(view, line, mode):
+    """Returns (first line, last line) of the block containing line.
+
+    Blank lines are in the block of the run of blank lines around them.
+    In 'indentation' mode, the block of a line is the surrounding lines that are
+    indented at least as far as it is, not counting blank lines at either end.
+    """
+    text = view.substr(line)
+    indentation = len(text) - len(text.lstrip())
+    if mode == 'paragraph' or indentation == len(text):
+        blank = indentation == len(text)
+        def in_block(text):
+            return (text.strip() == '') == blank
+        return (find_block_end(view, line, -1, in_block),
+                find_block_end(view, line, 1, in_block))
+    if mode != 'indentation':
+        raise ValueError('Unknown expansion mode: {!r}'.format(mode))
+    def is_filled(text):
+        return text.strip() != ''
+    if indentation == 0:
+        # Every line is indented at least as far, so the block is everything
+        # but the blank lines at the start and end of the buffer. Search from
+        # the ends rather than walk the whole buffer.
+        first_line = view.line(0)
+        if not is_filled(view.substr(first_line)):
+            first_line = view.line(find_block_end(
+                view, first_line, 1, lambda text: not is_filled(text)).end() + 1)
+        last_line = view.line(view.size())
+        if not is_filled(view.substr(last_line)):
+            last_line = view.line(find_block_end(
+                view, last_line, -1, lambda text: not is_filled(text)).begin() - 1)
+        return first_line, last_line
+    def in_block(text):
+        return not is_filled(text) or len(text) - len(text.lstrip()) >= indentation
+    return (find_block_end(view, line, -1, in_block, is_filled),
+            find_block_end(view, line, 1, in_block, is_filled))
+
+
+def find_block_end(view, line, direction, in_block, is_end=None):
+    """Returns the furthest line from line in direction that ends its block.
+
+    Walks up (-1) or down (1) one line at a time, until in_block is false for
+    the text of a line. Of the lines passed, the furthest one is returned, or
+    only the furthest one that is_end is true for if given. If there is none,
+    returns line.
+    """
+    block_end = line
+    while True:
+        if direction < 0:
+            if line.begin() == 0:
+                return block_end
+            line = view.line(line.begin() - 1)
+        else:
+            if line.end() >= view.size():
+                return block_end
+            line = view.line(line.end() + 1)
+        text = view.substr(line)
+        if not in_block(text):
+            return block_end
+        if is_end is None or is_end(text):
+            block_end = line
+
+
+def discard_line_index(view):
+    """Drops the view's cached line index, once a command is done with it.
+
+    Does nothing if the line index module was never loaded, so that it isn't
+    loaded just to discard an index that was never built.
+    """
+    line_index = sys.modules.get(__name__.rpartition('.')[0] + '.ccpl.line_index')
+    if line_index is not None:
+        line_index.discard_line_index(view)
+
+
+def get_line_blocks(view):
+    """Returns the selection expanded to full lines, with adjacent lines merged.
+
+    Unlike get_expanded_selection, regions on touching lines are also merged,
+    because they have to move together.
+    Returns a list of ExpandedRegion.
+    """
+    line_blocks = []
+    for expanded_region in get_expanded_selection(view):
+        if line_blocks and expanded_region.begin() == line_blocks[-1].end():
+            # Extend the previous block to include this one.
+            line_blocks[-1].b = expanded_region.end()
+            line_blocks[-1].original_regions.extend(
+                expanded_region.original_regions)
+        else:
+            line_blocks.append(expanded_region)
+    return line_blocks
+
+
+def get_selection_lines_text(selection, view):
+    """Returns the text of the selection, ending in a \n.
+
+    The selection is assumed to be full lines.
+    """
+    text = ''.join(view.substr(region) for region in selection)
+    # If missing, add a trailing \n, because these are line selections.
+    if text == '' or text[-1] != '\n':
+        text += '\n'
+    return text
+
+
+def get_register_store():
+    """Returns the RegisterStore that holds the named registers."""
+    global _register_store
+    if _register_store is None:
+        from .ccpl.registers import RegisterStore
+        path = os.path.join(sublime.cache_path(), 'Copy Cut and Paste Lines',
+                            'registers')
+        _register_store = RegisterStore(path, sublime.set_timeout_async)
+    return _register_store
+
+
+def copy_selection_lines(selection, view, register=None):
+    """Copies the selection to the clipboard, or to the named register.
 
     The selection is assumed to be full lines.
     """
     if len(selection) == 0:
         return
-    clipboard_string = ''
-    for region in selection:
-        clipboard_string += view.substr(region)
-    # If missing, add a trailing \n, because these are line selections.
-    if clipboard_string == '' or clipboard_string[-1] != '\n':
-        clipboard_string += '\n'
-    sublime.set_clipboard(clipboard_string)
+    text = get_selection_lines_text(selection, view)
+    if register is None:
+        sublime.set_clipboard(text)
+    else:
+        get_register_store().set(register, text)
 
 
 def is_selection_within_a_line(view):
@@ -75,25 +256,109 @@ def is_selection_within_a_line(view):
         # Expand selection_coverage to include this region.
         selection_coverage = selection_coverage.cover(region)
         all_cursors = all_cursors and region.empty()
-    selection_within_one_line = (len(view.lines(selection_coverage)) == 1)
+    # Check the line at the start, rather than listing every covered line.
+    selection_within_one_line = (
+        selection_coverage.end() <= view.line(selection_coverage.begin()).end())
     return selection_within_one_line and not all_cursors
 
 
+def is_rectangular_selection(view):
+    """Returns true if the selection is a box (rectangular) selection.
+
+    See line_index.is_box for what counts as a box.
+    """
+    selection = view.sel()
+    if len(selection) < 2:
+        return False
+    if all(region.empty() for region in selection):
+        # Multiple cursors, which should still operate on full lines.
+        return False
+    from .ccpl.line_index import LineIndex, is_box
+    # Check the first two rows before looking at the rest of the selection.
+    first_line = view.line(selection[0].begin())
+    if view.line(selection[1].begin()).begin() != first_line.end() + 1:
+        return False
+    # Only look at the selected rows, so a huge buffer isn't scanned. A box has
+    # a region on each row, so check that before reading the rows.
+    first_row = view.rowcol(first_line.begin())[0]
+    last_line = view.line(selection[-1].end())
+    if view.rowcol(last_line.begin())[0] - first_row + 1 != len(selection):
+        return False
+    if len(selection) >= LINE_INDEX_MIN_REGIONS:
+        # Index just the selected rows, to get them without calling view.line.
+        def read(begin, end):
+            return view.substr(sublime.Region(begin, end))
+        rows_index = LineIndex(read, last_line.end(), begin=first_line.begin())
+        return rows_index.is_box(list(selection))
+    lines = [view.line(region.begin()) for region in selection]
+    for previous_line, line in zip(lines, lines[1:]):
+        if line.begin() != previous_line.end() + 1:
+            return False
+    return is_box([region.begin() for region in selection],
+                  [region.end() for region in selection],
+                  [line.begin() for line in lines],
+                  [line.end() for line in lines])
+
+
 def is_single_cursor_selection(view):
     """Returns true if the selection is only a single cursor."""
     selection = view.sel()
     return len(selection) == 1 and selection[0].empty()
 
 
-def get_point(view, row, column):
-    """Returns the point that corresponds to (row, column).
+def get_indentation(text):
+    """Returns the whitespace at the start of text."""
+    return text[:len(text) - len(text.lstrip(' \t'))]
+
+
+def get_common_indentation(lines):
+    """Returns the indentation shared by all of the non-blank lines."""
+    indentations = [get_indentation(line) for line in lines if line.strip()]
+    return os.path.commonprefix(indentations)
+
+
+def reindent_lines(lines, old_indentation, new_indentation):
+    """Returns lines joined together, with old_indentation replaced.
+
+    Each line must start with old_indentation, except for blank lines, which are
+    left as they are.
+    """
+    start = len(old_indentation)
+    return ''.join(new_indentation + line[start:] if line.strip() else line
+                   for line in lines)
+
+
+def get_columns(view, points):
+    """Returns the column of each point.
+
+    Same as view.rowcol(point)[1] for each point, except that many points are
+    looked up all at once in the line index.
+    """
+    if not use_line_index(view, len(points)):
+        return [view.rowcol(point)[1] for point in points]
+    from .ccpl.line_index import get_line_index
+    return get_line_index(view).rowcols(points)[1]
+
+
+def get_cursor_columns(expanded_selection, view):
+    """Returns a list of the cursor columns of each ExpandedRegion.
+
+    The cursor columns are the columns of the original regions' cursors.
+    """
+    columns = iter(get_columns(view, [
+        region.b
+        for expanded_region in expanded_selection
+        for region in expanded_region.original_regions]))
+    return [[next(columns) for _ in expanded_region.original_regions]
+            for expanded_region in expanded_selection]
+
+
+def get_line_point(line, column):
+    """Returns the point at column in line.
 
-    Same as view.text_point(row, column) except if column goes past the end
-    of the line, it returns the end of the line instead.
+    If column goes past the end of the line, returns the end of the line instead.
     """
-    row_start = view.text_point(row, 0)
-    line_length = len(view.line(row_start))
-    return row_start + min(column, line_length)
+    return line.begin() + min(column, line.size())
 
 
 def append_text(view, edit, string):
@@ -118,142 +383,315 @@ def insert_without_moving_cursor(view, edit, point, string):
         view.insert(edit, point, string)
 
 
+def erase_selection_lines(view, edit, mode='line', copy=None):
+    """Erases all lines containing a selection, optionally copying them first.
+
+    Cursors are left in their original columns on the line below each erased
+    block, or on the line above if there is no line below.
+    copy: Called as copy(expanded_selection, view) before the lines are erased,
+          e.g. copy_selection_lines.
+    """
+    # Add a trailing newline to make things easier. It will be removed later.
+    append_text(view, edit, '\n')
+
+    # 1. Copy the lines.
+    expanded_selection = get_expanded_selection(view, mode)
+    if copy is not None:
+        copy(expanded_selection, view)
+
+    # 2. Erase the lines.
+    # The target columns are the columns of the selections' cursors. Find them
+    # all before anything is erased.
+    cursor_columns = get_cursor_columns(expanded_selection, view)
+    # Work backwards to avoid altering other selections.
+    for erase_region, target_columns in reversed(list(zip(expanded_selection,
+                                                          cursor_columns))):
+        # Clear the old selections.
+        view.sel().subtract(erase_region)
+        # Add cursors back in.
+        # The target line is the line below the selection.
+        if erase_region.end() < view.size():
+            target_line = view.line(erase_region.end())
+        # If there is no line below, use the line above instead.
+        elif erase_region.begin() > 0:
+            target_line = view.line(erase_region.begin() - 1)
+        else:
+            target_line = sublime.Region(0, 0)
+        for target_column in target_columns:
+            new_cursor_point = get_line_point(target_line, target_column)
+            view.sel().add(sublime.Region(new_cursor_point, new_cursor_point))
+        # Erase the cut region.
+        view.erase(edit, erase_region)
+
+    # Remove the extra newline that was added earlier.
+    view.erase(edit, sublime.Region(view.size() - 1, view.size()))
+    discard_line_index(view)
+
+
+class PasteText:
+    """Lines of text to paste, prepared once so they can be pasted many times.
+
+    Line endings are normalized to \n. For reindenting, the text is only split
+    into lines once, and each reindented version is only built once.
+    """
+    def __init__(self, text):
+        self.text = text.replace('\r\n', '\n')
+        self._lines = None
+        self._indentation = None
+        self._reindented_texts = {}
+
+    def is_lines(self):
+        """Returns whether the text contains lines, rather than part of a line."""
+        return '\n' in self.text
+
+    def reindented(self, indentation):
+        """Returns the text with its common indentation replaced by indentation."""
+        if self._lines is None:
+            self._lines = self.text.splitlines(True)
+            self._indentation = get_common_indentation(self._lines)
+            self._reindented_texts[self._indentation] = self.text
+        reindented_text = self._reindented_texts.get(indentation)
+        if reindented_text is None:
+            reindented_text = reindent_lines(self._lines, self._indentation,
+                                             indentation)
+            self._reindented_texts[indentation] = reindented_text
+        return reindented_text
+
+
+def paste_lines(view, edit, paste_text, reindent=False):
+    """Pastes the lines of a PasteText at the selection.
+
+    Lines containing a selection are overwritten with text, and lines with only
+    cursors have text pasted below them. See CcplPasteCommand for details.
+    """
+    selection = view.sel()
+
+    # Add a trailing newline to make things easier. It will be removed later.
+    append_text(view, edit, '\n')
+
+    expanded_selection = get_expanded_selection(view)
+    # The target columns are the columns the selections' cursors are in. Find
+    # them all before anything is pasted.
+    cursor_columns = get_cursor_columns(expanded_selection, view)
+    # Work backwords to avoid messing up other lines.
+    for lines_region, target_columns in reversed(list(zip(expanded_selection,
+                                                          cursor_columns))):
+        # Don't overwrite if there are only cursors on this line.
+        overwrite = False
+        for region in lines_region.original_regions:
+            if not region.empty():
+                overwrite = True
+            if region.a == 0 and view.substr(sublime.Region(0, 1)) == '\n':
+                # Also overwrite if on a blank first line.
+                overwrite = True
+        text = paste_text.text
+        if reindent:
+            # Match the line being overwritten or pasted below.
+            if overwrite:
+                target_line = view.line(lines_region.begin())
+            else:
+                target_line = view.line(lines_region.end() - 1)
+            text = paste_text.reindented(get_indentation(view.substr(target_line)))
+        if overwrite:
+            # Remove the selection so it isn't left behind.
+            selection.subtract(lines_region)
+            # Calculate where to put the remaining cursors.
+            new_cursor_points = []
+            # The target line is the starting line of the selection.
+            target_line = view.line(lines_region.begin())
+            for target_column in target_columns:
+                new_cursor_point = get_line_point(target_line, target_column)
+                new_cursor_points.append(new_cursor_point)
+            # Overwrite with the text.
+            view.replace(edit, lines_region, text)
+            # Put the remaining cursors back in.
+            for new_cursor_point in new_cursor_points:
+                view.sel().add(sublime.Region(new_cursor_point, new_cursor_point))
+        else:
+            paste_position = lines_region.end()
+            insert_without_moving_cursor(view, edit, paste_position, text)
+
+    # Remove the extra newline that was added earlier.
+    view.erase(edit, sublime.Region(view.size() - 1, view.size()))
+    discard_line_index(view)
+
+
+def move_selection_lines(view, edit, direction):
+    """Moves all lines containing a selection up (-1) or down (1) by one line.
+
+    Each block of lines swaps places with the line next to it. Only the swapped
+    lines are replaced, working backwards so earlier positions stay valid, and
+    the cursors are shifted arithmetically. The text between blocks is left
+    alone, so the cost is linear in the number of moved lines.
+    """
+    # Add a trailing newline to make things easier. It will be removed later.
+    append_text(view, edit, '\n')
+
+    swaps = []
+    new_selection = []
+    for block in get_line_blocks(view):
+        if direction < 0 and block.begin() > 0:
+            # Swap with the line above.
+            swap_line = view.full_line(block.begin() - 1)
+            swap_region = sublime.Region(swap_line.begin(), block.end())
+            swap_text = view.substr(block) + view.substr(swap_line)
+            shift = -swap_line.size()
+        elif direction > 0 and block.end() < view.size():
+            # Swap with the line below.
+            swap_line = view.full_line(block.end())
+            swap_region = sublime.Region(block.begin(), swap_line.end())
+            swap_text = view.substr(swap_line) + view.substr(block)
+            shift = swap_line.size()
+        else:
+            # The block is already at the top or bottom, so leave it in place.
+            swap_region = None
+            shift = 0
+        if swap_region is not None:
+            swaps.append((swap_region, swap_text))
+        for region in block.original_regions:
+            new_selection.append(sublime.Region(region.a + shift, region.b + shift))
+
+    if swaps:
+        # Each swap keeps the same length, so positions before it don't change.
+        for swap_region, swap_text in reversed(swaps):
+            view.replace(edit, swap_region, swap_text)
+        view.sel().clear()
+        view.sel().add_all(new_selection)
+
+    # Remove the extra newline that was added earlier.
+    view.erase(edit, sublime.Region(view.size() - 1, view.size()))
+    discard_line_index(view)
+
+
 class CcplCopyCommand(sublime_plugin.TextCommand):
     """Copies all lines containing a selection.
 
-    Exception: Does a normal copy for a selection within a single line.
+    Exception: Does a normal copy for a selection within a single line or a box
+               selection.
     Behavior:
     -Lines put into the clipboard will always end in \n.
     -Lines containing multiple selections are only copied once.
+    -mode='paragraph' or mode='indentation' copies the enclosing blocks instead.
+    -register='name' copies to a named register instead of the clipboard.
+     Registers always hold full lines, even for selections within a line.
     """
 
     def description(self):
         return "Copy Lines"
 
-    def run(self, edit):
+    def run(self, edit, mode='line', register=None):
         view = self.view
 
-        # Do a regular copy if the selection is within a single line.
-        if is_selection_within_a_line(view):
+        # Do a regular copy if the selection is within a single line or a box.
+        if (mode == 'line' and register is None and
+                (is_selection_within_a_line(view) or
+                 is_rectangular_selection(view))):
             view.run_command('copy')
             return
 
-        expanded_selection = get_expanded_selection(view)
-        copy_selection_lines(expanded_selection, view)
+        expanded_selection = get_expanded_selection(view, mode)
+        copy_selection_lines(expanded_selection, view, register)
+        discard_line_index(view)
 
 
 class CcplCutCommand(sublime_plugin.TextCommand):
     """Cuts all lines containing a selection.
 
-    Exception: Does a normal cut for a selection within a single line.
+    Exception: Does a normal cut for a selection within a single line or a box
+               selection.
 
     Behavior:
     -Clipboard is set the same as in CcplCopy.
     -Cursors are left in their original positions if possible. This may result
      in multiple cursors within a line.
+    -mode='paragraph' or mode='indentation' cuts the enclosing blocks instead.
+    -register='name' cuts to a named register instead of the clipboard.
     """
 
     def description(self):
         return "Cut Lines"
 
-    def run(self, edit):
+    def run(self, edit, mode='line', register=None):
         view = self.view
 
-        # Do a regular cut if the selection is within a single line.
-        if is_selection_within_a_line(view):
+        # Do a regular cut if the selection is within a single line or a box.
+        if (mode == 'line' and register is None and
+                (is_selection_within_a_line(view) or
+                 is_rectangular_selection(view))):
             view.run_command('cut')
             return
 
-        # Add a trailing newline to make things easier. It will be removed later.
-        append_text(view, edit, '\n')
+        copy = functools.partial(copy_selection_lines, register=register)
+        erase_selection_lines(view, edit, mode, copy=copy)
 
-        # 1. Copy the lines.
-        expanded_selection = get_expanded_selection(view)
-        copy_selection_lines(expanded_selection, view)
 
-        # 2. Erase the lines.
-        # Work backwards to avoid altering other selections.
-        for erase_region in reversed(expanded_selection):
-            # Clear the old selections.
-            view.sel().subtract(erase_region)
-            # Add cursors back in.
-            # The target row is the row below the selection.
-            target_row = view.rowcol(erase_region.end())[0]
-            # If there is no line below, use the line above instead.
-            if erase_region.end() == view.size():
-                target_row = view.rowcol(erase_region.begin())[0] - 1
-            for selection_region in erase_region.original_regions:
-                # The target column is the column of the selection's cursor.
-                target_column = view.rowcol(selection_region.b)[1]
-                new_cursor_point = get_point(view, target_row, target_column)
-                view.sel().add(sublime.Region(new_cursor_point, new_cursor_point))
-            # Erase the cut region.
-            view.erase(edit, erase_region)
+class CcplDeleteCommand(sublime_plugin.TextCommand):
+    """Deletes all lines containing a selection without touching the clipboard.
 
-        # Remove the extra newline that was added earlier.
-        view.erase(edit, sublime.Region(view.size() - 1, view.size()))
+    Exception: Deletes only the selected text for a selection within a single
+               line or a box selection.
+
+    Behavior:
+    -Lines, cursors, and modes are handled the same as in CcplCut.
+    -The clipboard is left unchanged.
+    """
+
+    def description(self):
+        return "Delete Lines"
+
+    def run(self, edit, mode='line'):
+        view = self.view
+
+        # Delete only the selected text if the selection is within a single line
+        # or a box.
+        if mode == 'line' and (is_selection_within_a_line(view) or
+                               is_rectangular_selection(view)):
+            # Work backwards to avoid altering other selections.
+            for region in reversed(list(view.sel())):
+                view.erase(edit, region)
+            return
+
+        erase_selection_lines(view, edit, mode)
 
 
 class CcplPasteCommand(sublime_plugin.TextCommand):
     """Overwrites any lines containing a selection with the clipboard.
 
-    Exception: Does a normal paste if the clipboard does not contain lines of text.
+    Exception: Does a normal paste if the clipboard does not contain lines of
+               text, or if pasting into a box selection.
     Behavior:
     -Lines containing a selection are overwritten with the clipboard.
     -Cursor-only selections have the clipboard pasted below them.
     -Paste is done once for each selection.
+    -reindent=True shifts the pasted lines to the indentation of the line being
+     overwritten, or of the line they are pasted below.
+    -register='name' pastes from a named register instead of the clipboard.
     """
 
     def description(self):
         return "Paste Lines"
 
-    def run(self, edit):
+    def run(self, edit, reindent=False, register=None):
         view = self.view
-        selection = view.sel()
-        clipboard = sublime.get_clipboard()
 
-        # Do a regular paste if the clipboard doesn't contain lines of text.
-        if not '\n' in clipboard:
-            view.run_command('paste')
+        if register is not None:
+            # Registers always hold full lines.
+            text = get_register_store().get(register)
+            if text is None:
+                sublime.status_message('Register {!r} is empty'.format(register))
+                return
+            paste_lines(view, edit, PasteText(text), reindent)
             return
 
-        # Add a trailing newline to make things easier. It will be removed later.
-        append_text(view, edit, '\n')
+        paste_text = PasteText(sublime.get_clipboard())
 
-        expanded_selection = get_expanded_selection(view)
-        # Work backwords to avoid messing up other lines.
-        for lines_region in reversed(expanded_selection):
-            # Don't overwrite if there are only cursors on this line.
-            overwrite = False
-            for region in lines_region.original_regions:
-                if not region.empty():
-                    overwrite = True
-                if region.a == 0 and view.substr(sublime.Region(0, 1)) == '\n':
-                    # Also overwrite if on a blank first line.
-                    overwrite = True
-            if overwrite:
-                # Remove the selection so it isn't left behind.
-                selection.subtract(lines_region)
-                # Calculate where to put the remaining cursors.
-                new_cursor_points = []
-                # The target row is the starting row of the selection.
-                target_row = view.rowcol(lines_region.begin())[0]
-                for selection_region in lines_region.original_regions:
-                    # The target column is the column the selection's cursor is in.
-                    target_column = view.rowcol(selection_region.b)[1]
-                    new_cursor_point = get_point(view, target_row, target_column)
-                    new_cursor_points.append(new_cursor_point)
-                # Overwrite with the clipboard.
-                view.replace(edit, lines_region, clipboard)
-                # Put the remaining cursors back in.
-                for new_cursor_point in new_cursor_points:
-                    view.sel().add(sublime.Region(new_cursor_point, new_cursor_point))
-            else:
-                paste_position = lines_region.end()
-                insert_without_moving_cursor(view, edit, paste_position, clipboard)
+        # Do a regular paste if the clipboard doesn't contain lines of text, or
+        # if pasting into a box selection.
+        if not paste_text.is_lines() or is_rectangular_selection(view):
+            view.run_command('paste')
+            return
 
-        # Remove the extra newline that was added earlier.
-        view.erase(edit, sublime.Region(view.size() - 1, view.size()))
+        paste_lines(view, edit, paste_text, reindent)
 
 
 class CcplDuplicateCommand(sublime_plugin.TextCommand):
@@ -264,18 +702,19 @@ class CcplDuplicateCommand(sublime_plugin.TextCommand):
     -A line with multiple selections is only duplicated once. Otherwise, each
      selection is duplicated independently.
     -Duplicated text is placed below the original.
+    -mode='paragraph' or mode='indentation' duplicates the enclosing blocks instead.
     """
 
     def description(self):
         return "Duplicate Lines"
 
-    def run(self, edit):
+    def run(self, edit, mode='line'):
         view = self.view
         if view.size() == 0:
             return
 
         # Do a regular duplicate if the selection is within a single line.
-        if is_selection_within_a_line(view):
+        if mode == 'line' and is_selection_within_a_line(view):
             # Note: The command is named duplicate_line, but it can duplicate
             # text within a line as well.
             view.run_command('duplicate_line')
@@ -284,7 +723,7 @@ class CcplDuplicateCommand(sublime_plugin.TextCommand):
         # Add a trailing newline to make things easier. It will be removed later.
         append_text(view, edit, '\n')
 
-        expanded_selection = get_expanded_selection(view)
+        expanded_selection = get_expanded_selection(view, mode)
         # Work backwards to avoid altering other selections.
         for region in reversed(expanded_selection):
             text = view.substr(region)
@@ -292,5 +731,214 @@ class CcplDuplicateCommand(sublime_plugin.TextCommand):
 
         # Remove the extra newline that was added earlier.
         view.erase(edit, sublime.Region(view.size() - 1, view.size()))
+        discard_line_index(view)
+
+
+class CcplMoveUpCommand(sublime_plugin.TextCommand):
+    """Moves all lines containing a selection up by one line.
+
+    Behavior:
+    -Lines containing multiple selections are only moved once.
+    -Selections on adjacent lines are moved together as a single block.
+    -A block that is already at the top of the buffer is left in place.
+    """
+
+    def description(self):
+        return "Move Lines Up"
+
+    def run(self, edit):
+        move_selection_lines(self.view, edit, -1)
+
+
+class CcplMoveDownCommand(sublime_plugin.TextCommand):
+    """Moves all lines containing a selection down by one line.
+
+    Behavior:
+    -Lines containing multiple selections are only moved once.
+    -Selections on adjacent lines are moved together as a single block.
+    -A block that is already at the bottom of the buffer is left in place.
+    """
+
+    def description(self):
+        return "Move Lines Down"
+
+    def run(self, edit):
+        move_selection_lines(self.view, edit, 1)
+
+
+class CcplSendLinesToViewCommand(sublime_plugin.TextCommand):
+    """Pastes all lines containing a selection into another view.
+
+    Behavior:
+    -Lines are pasted at the other view's selection the same as in CcplPaste.
+    -cut=True also erases the lines from this view, the same as in CcplCut.
+    -The clipboard is left unchanged.
+    """
+
+    def description(self):
+        return "Send Lines to View"
+
+    def run(self, edit, view_id, cut=False, reindent=False):
+        global _lines_in_transit
+        view = self.view
+        target_view = sublime.View(view_id)
+        if view_id == view.id() or not target_view.is_valid():
+            return
 
+        sent_lines = []
+        def send_lines(expanded_selection, view):
+            if len(expanded_selection) > 0:
+                sent_lines.append(get_selection_lines_text(expanded_selection, view))
+
+        if cut:
+            erase_selection_lines(view, edit, copy=send_lines)
+        else:
+            send_lines(get_expanded_selection(view), view)
+            discard_line_index(view)
+        if not sent_lines:
+            return
+
+        _lines_in_transit = PasteText(sent_lines[0])
+        try:
+            target_view.run_command('ccpl_receive_lines', {'reindent': reindent})
+        finally:
+            _lines_in_transit = None
+
+
+class CcplReceiveLinesCommand(sublime_plugin.TextCommand):
+    """Pastes the lines sent by CcplSendLinesToView or CcplPasteToSelectedViews.
+
+    Not meant to be run directly.
+    """
+
+    def run(self, edit, reindent=False):
+        if _lines_in_transit is not None:
+            paste_lines(self.view, edit, _lines_in_transit, reindent)
+
+
+class CcplMoveLinesToGroupCommand(sublime_plugin.WindowCommand):
+    """Moves all lines containing a selection to the active view in another group.
+
+    Behavior:
+    -Lines are cut from the active view and pasted into the view the same as in
+     CcplSendLinesToView, without going through the clipboard.
+    -Focus moves to the other group afterwards.
+    """
+
+    def description(self):
+        return "Move Lines to Group"
+
+    def run(self, group, reindent=False):
+        window = self.window
+        view = window.active_view()
+        target_view = window.active_view_in_group(group)
+        if view is None or target_view is None or target_view.id() == view.id():
+            return
+        view.run_command('ccpl_send_lines_to_view', {
+            'view_id': target_view.id(), 'cut': True, 'reindent': reindent})
+        window.focus_view(target_view)
+
+
+class CcplPasteToSelectedViewsCommand(sublime_plugin.WindowCommand):
+    """Pastes the clipboard into every selected tab.
+
+    Behavior:
+    -Lines are pasted at each view's selection the same as in CcplPaste.
+    -The clipboard is only read and prepared once, however many tabs there are.
+    -Views of the same file are only pasted into once.
+    -The total time taken is shown in the status bar.
+    """
+
+    def description(self):
+        return "Paste Lines to Selected Views"
+
+    def run(self, reindent=False):
+        global _lines_in_transit
+        start_time = time.perf_counter()
+        paste_text = PasteText(sublime.get_clipboard())
+        views = self.get_selected_views()
+        _lines_in_transit = paste_text
+        try:
+            for view in views:
+                # Do a regular paste, the same as CcplPaste would.
+                if not paste_text.is_lines() or is_rectangular_selection(view):
+                    view.run_command('paste')
+                else:
+                    view.run_command('ccpl_receive_lines', {'reindent': reindent})
+        finally:
+            _lines_in_transit = None
+        sublime.status_message('Pasted into {} views in {:.0f} ms'.format(
+            len(views), (time.perf_counter() - start_time) * 1000))
+
+    def get_selected_views(self):
+        """Returns the views in the selected tabs, with one view per file."""
+        window = self.window
+        if hasattr(window, 'selected_sheets'):
+            views = [sheet.view() for sheet in window.selected_sheets()]
+        else:
+            # Only one tab can be selected in Sublime Text 3.
+            views = [window.active_view()]
+        selected_views = []
+        buffer_ids = set()
+        for view in views:
+            if view is not None and view.buffer_id() not in buffer_ids:
+                buffer_ids.add(view.buffer_id())
+                selected_views.append(view)
+        return selected_views
+
+
+def show_results_view(window, name, command, args=None):
+    """Opens a scratch view called name, and runs the text command in it."""
+    view = window.new_file()
+    view.set_scratch(True)
+    view.set_name(name)
+    # Need to run a text command to edit the view.
+    view.run_command(command, args)
+
+
+class CcplRunTestsCommand(sublime_plugin.WindowCommand):
+    """Run the tests and show them in a new tab."""
+
+    def description(self):
+        return "Run CutCopyPasteLines tests"
+
+    def run(self):
+        show_results_view(self.window, "Test Results", 'ccpl_show_test_output')
+
+
+class CcplShowTestOutputCommand(sublime_plugin.TextCommand):
+    """Run the tests and show them in this tab."""
+
+    def description(self):
+        return "Run CutCopyPasteLines tests"
+
+    def run(self, edit):
+        # The tests are only loaded when they are run, to keep startup fast.
+        from .tests.test_commands import show_test_output
+        show_test_output(self.view, edit)
+
+
+class CcplRunBenchmarksCommand(sublime_plugin.WindowCommand):
+    """Run the benchmarks and show them in a new tab."""
+
+    def description(self):
+        return "Run CutCopyPasteLines benchmarks"
+
+    def run(self, update_baseline=False, threshold=None, large_file_size=0):
+        show_results_view(self.window, "Benchmark Results",
+                          'ccpl_show_benchmark_output',
+                          {'update_baseline': update_baseline, 'threshold': threshold,
+                           'large_file_size': large_file_size})
+
+
+class CcplShowBenchmarkOutputCommand(sublime_plugin.TextCommand):
+    """Run the benchmarks and show them in this tab."""
+
+    def description(self):
+        return "Run CutCopyPasteLines benchmarks"
 
+    def run(self, edit, update_baseline=False, threshold=None, large_file_size=0):
+        # The benchmarks are only loaded when they are run, to keep startup fast.
+        from .tests.benchmarks import show_benchmark_output
+        show_benchmark_output(self.view, edit, update_baseline, threshold,
+                              large_file_size)
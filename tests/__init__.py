@@ -0,0 +1,5 @@
+"""Tests and benchmarks for the commands.
+
+These are kept out of the package's top level so that Sublime Text doesn't load
+them at startup. main.py imports them when they are run.
+"""
@@ -0,0 +1,395 @@
+"""Benchmarks to measure the time and memory the commands take on large selections
+
+To run the benchmarks:
+1. Open the console. (View->Show Console)
+2. Paste the line below into the console then press enter.
+   window.run_command('ccpl_run_benchmarks')
+
+The large file benchmarks only run when a file size in bytes is given, since
+they write a temporary file that size. The commands are run on it in a
+HeadlessView, so the file is never loaded into memory all at once. For example,
+to run them on a 1 GB file:
+   window.run_command('ccpl_run_benchmarks', {'large_file_size': 1024 ** 3})
+
+The peak memory and the number of memory blocks each command leaves allocated
+are measured with tracemalloc, and compared to a saved baseline. A benchmark
+fails if either grows by more than the threshold. Benchmarks without a baseline
+yet, such as the first run with a new large file size, have theirs saved. To
+save all the current results as the new baseline, or to change the threshold,
+run:
+   window.run_command('ccpl_run_benchmarks', {'update_baseline': True})
+   window.run_command('ccpl_run_benchmarks', {'threshold': 0.5})
+"""
+
+import sublime
+import collections
+import importlib
+import json
+import os
+import tempfile
+import time
+from .. import main
+from .headless_view import HeadlessView
+
+try:
+    import tracemalloc
+except ImportError:
+    # Only available from Python 3.4.
+    tracemalloc = None
+
+
+# How many times each benchmark is run. The fastest run is reported.
+REPEAT_COUNT = 3
+
+# Modules that are imported on demand, to compare against main.py.
+OPTIONAL_MODULES = ['ccpl.line_index', 'ccpl.registers', 'tests.test_commands']
+
+# Lines of the large file. They are all the same length, so that the position
+# of each line can be calculated.
+LARGE_FILE_LINE = 'log entry {:010d}\n'
+LARGE_FILE_LINE_LENGTH = len(LARGE_FILE_LINE.format(0))
+
+# Cursors spread evenly through the large file. This is below
+# main.LINE_INDEX_MIN_REGIONS, so the commands ask the view about each cursor.
+# Copy, cut, and paste are also run with main.LINE_INDEX_MIN_REGIONS cursors,
+# which are too spread out for the commands to index the whole file either.
+LARGE_FILE_CURSOR_COUNT = 500
+
+# A benchmark fails if its memory use grows by more than this fraction of the
+# baseline.
+MEMORY_REGRESSION_THRESHOLD = 0.2
+
+# peak_size: The most bytes allocated at once while the command ran.
+# block_count: The number of memory blocks the command left allocated.
+# Both are None if tracemalloc isn't available.
+BenchmarkResult = collections.namedtuple(
+    'BenchmarkResult', ['seconds', 'peak_size', 'block_count'])
+
+
+def show_benchmark_output(view, edit, update_baseline=False, threshold=None,
+                          large_file_size=0):
+    """Run the benchmarks and show the results in view.
+
+    update_baseline: Whether to save the memory use as the new baseline. It is
+                     always saved for benchmarks without a baseline.
+    threshold: Fraction of the baseline that memory use can grow by before a
+               benchmark fails. Defaults to MEMORY_REGRESSION_THRESHOLD.
+    large_file_size: Size of the file for the large file benchmarks, in bytes.
+                     They are skipped if it is 0.
+    """
+    if threshold is None:
+        threshold = MEMORY_REGRESSION_THRESHOLD
+    baseline_path = get_baseline_path()
+    baseline = load_baseline(baseline_path)
+    output = "Import times:\n"
+    output += "    {:<40}{:>10.2f} ms\n".format(
+        "main (loaded at startup)", measure_import_time(main) * 1000)
+    package_name = main.__name__.rpartition('.')[0]
+    for module_name in OPTIONAL_MODULES:
+        module = importlib.import_module('.' + module_name, package_name)
+        output += "    {:<40}{:>10.2f} ms\n".format(
+            module_name + " (on demand)", measure_import_time(module) * 1000)
+    results = collections.OrderedDict()
+    output += "\nCommand times and memory:\n"
+    for benchmark in get_benchmarks():
+        results[benchmark.name] = benchmark.run(view, edit)
+        output += format_result(benchmark.name, results[benchmark.name],
+                                baseline.get(benchmark.name), threshold)
+    if large_file_size > 0:
+        output += "\nLarge file command times and memory:\n"
+        file_descriptor, path = tempfile.mkstemp(suffix='.log')
+        os.close(file_descriptor)
+        try:
+            line_count = write_large_file(path, large_file_size)
+            for benchmark in get_large_file_benchmarks(line_count):
+                results[benchmark.name] = benchmark.run(path)
+                output += format_result(benchmark.name, results[benchmark.name],
+                                        baseline.get(benchmark.name), threshold)
+        finally:
+            os.remove(path)
+    # Summarize the memory use compared to the baseline.
+    if tracemalloc is None:
+        summary = "Memory isn't measured, since tracemalloc isn't available."
+    else:
+        compared_names = [name for name in results if name in baseline]
+        pass_count = sum(not get_regressions(results[name], baseline[name], threshold)
+                         for name in compared_names)
+        summary = "{} of {} benchmarks within {:.0%} of the memory baseline.".format(
+            pass_count, len(compared_names), threshold)
+        if update_baseline:
+            new_results = results
+        else:
+            new_results = collections.OrderedDict(
+                (name, result) for name, result in results.items()
+                if name not in baseline)
+        if new_results:
+            save_baseline(baseline_path, baseline, new_results)
+            summary += ("\nSaved the memory use of {} benchmarks as the baseline "
+                        "in {}".format(len(new_results), baseline_path))
+    output = summary + "\n\n" + output
+    # Show the output.
+    view.replace(edit, sublime.Region(0, view.size()), output)
+    view.sel().clear()
+
+
+def format_result(name, result, baseline_result, threshold):
+    """Returns a line of output for the result of a benchmark.
+
+    If it used more memory than baseline_result allows, the line says FAIL.
+    """
+    line = "    {:<40}{:>10.2f} ms".format(name, result.seconds * 1000)
+    if result.peak_size is not None:
+        line += "{:>12,} KB peak{:>10,} blocks".format(
+            result.peak_size // 1024, result.block_count)
+        if baseline_result is None:
+            line += "  no baseline"
+    if baseline_result is not None:
+        regressions = get_regressions(result, baseline_result, threshold)
+        if regressions:
+            line += "  FAIL - " + ", ".join(regressions)
+    return line + "\n"
+
+
+def get_regressions(result, baseline_result, threshold):
+    """Returns descriptions of the measurements that grew by more than threshold."""
+    regressions = []
+    for field, label in (('peak_size', "peak"), ('block_count', "blocks")):
+        value = getattr(result, field)
+        baseline_value = baseline_result.get(field)
+        if value is None or baseline_value is None:
+            continue
+        # Allow some growth from zero, so tiny baselines aren't too strict.
+        if value > max(baseline_value, 1) * (1 + threshold):
+            regressions.append("{} {:+.0%}".format(
+                label, value / max(baseline_value, 1) - 1))
+    return regressions
+
+
+def get_baseline_path():
+    """Returns the path of the file the memory baseline is saved in."""
+    return os.path.join(sublime.cache_path(), 'Copy Cut and Paste Lines',
+                        'benchmark_baseline.json')
+
+
+def load_baseline(path):
+    """Returns the saved memory use of each benchmark, keyed by name.
+
+    Returns an empty dictionary if no baseline has been saved.
+    """
+    try:
+        with open(path, encoding='utf-8') as baseline_file:
+            return json.load(baseline_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_baseline(path, baseline, results):
+    """Saves the memory use from results, a dictionary of BenchmarkResults.
+
+    The results are merged into baseline, as returned by load_baseline, so
+    benchmarks that weren't run keep their baseline.
+    """
+    baseline = collections.OrderedDict(baseline)
+    for name, result in results.items():
+        baseline[name] = {'peak_size': result.peak_size,
+                          'block_count': result.block_count}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as baseline_file:
+        json.dump(baseline, baseline_file, indent=4)
+
+
+def measure_import_time(module):
+    """Returns the seconds taken to compile and run the module's code again.
+
+    The code is run in a new namespace, so the loaded module isn't affected.
+    """
+    source = module.__loader__.get_source(module.__name__)
+    start_time = time.perf_counter()
+    code = compile(source, module.__file__, 'exec')
+    namespace = {
+        '__name__': module.__name__ + '_benchmark',
+        '__package__': module.__package__,
+        '__file__': module.__file__,
+    }
+    exec(code, namespace)
+    return time.perf_counter() - start_time
+
+
+def lines(line_count):
+    """Returns text with line_count numbered lines."""
+    return ''.join('line {}\n'.format(number) for number in range(line_count))
+
+
+def cursors(text, step):
+    """Returns a cursor at the start of every step'th line of text."""
+    selection = []
+    point = 0
+    for line_number, line in enumerate(text.splitlines(True)):
+        if line_number % step == 0:
+            selection.append(sublime.Region(point, point))
+        point += len(line)
+    return selection
+
+
+def write_large_file(path, size):
+    """Writes lines to the file at path until it is at least size bytes.
+
+    Returns the number of lines written.
+    """
+    block_line_count = 64 * 1024
+    line_count = 0
+    with open(path, 'w', encoding='latin-1', newline='') as large_file:
+        while line_count * LARGE_FILE_LINE_LENGTH < size:
+            large_file.write(''.join(LARGE_FILE_LINE.format(line_count + number)
+                                     for number in range(block_line_count)))
+            line_count += block_line_count
+    return line_count
+
+
+def large_file_cursors(line_count, cursor_count):
+    """Returns cursor_count cursors spread evenly through the lines."""
+    step = max(line_count // cursor_count, 1)
+    return [sublime.Region(row * LARGE_FILE_LINE_LENGTH)
+            for row in range(0, line_count, step)][:cursor_count]
+
+
+class Benchmark:
+    """Measures a command on generated text."""
+
+    def __init__(self, name, command, text, selection, clipboard='line\n',
+                 args=None):
+        """Specifies all information needed to run the benchmark.
+
+        Args:
+            text, selection, clipboard: The state before the command is run.
+            args: Dictionary of arguments to pass to the command.
+        """
+        self.name = name
+        self.command = command
+        self.text = text
+        self.selection = selection
+        self.clipboard = clipboard
+        self.args = args or {}
+
+    def get_command_class(self):
+        """Returns the class in main that implements the command."""
+        command_words = [word.capitalize() for word in self.command.split('_')]
+        class_name = 'Ccpl' + ''.join(command_words) + 'Command'
+        return getattr(main, class_name)
+
+    def run(self, view, edit):
+        """Returns a BenchmarkResult for the command."""
+        command_object = self.get_command_class()(view)
+        def run_once(trace):
+            # Initial state
+            view.replace(edit, sublime.Region(0, view.size()), self.text)
+            sublime.set_clipboard(self.clipboard)
+            view.sel().clear()
+            view.sel().add_all(self.selection)
+            # Call the command directly, the same as in the tests.
+            return run_command(command_object, edit, self.args, trace)
+        return measure(run_once)
+
+
+class LargeFileBenchmark(Benchmark):
+    """Measures a command on a large file, in a HeadlessView."""
+
+    def __init__(self, name, command, selection, clipboard='line\n', args=None):
+        super().__init__(name, command, None, selection, clipboard, args)
+
+    def run(self, path):
+        """Returns a BenchmarkResult for the command on the file at path."""
+        def run_once(trace):
+            # Open the file again, so each run starts from the unedited text.
+            view = HeadlessView(path)
+            try:
+                sublime.set_clipboard(self.clipboard)
+                view.sel().add_all(self.selection)
+                command_object = self.get_command_class()(view)
+                return run_command(command_object, None, self.args, trace)
+            finally:
+                view.close()
+        return measure(run_once)
+
+
+def run_command(command_object, edit, args, trace):
+    """Runs the command, and returns (seconds, peak_size, block_count).
+
+    Memory is only measured if trace is true, otherwise peak_size and
+    block_count are None.
+    """
+    if not trace:
+        start_time = time.perf_counter()
+        command_object.run(edit, **args)
+        return time.perf_counter() - start_time, None, None
+    tracemalloc.start()
+    try:
+        start_time = time.perf_counter()
+        command_object.run(edit, **args)
+        seconds = time.perf_counter() - start_time
+        peak_size = tracemalloc.get_traced_memory()[1]
+        # Only blocks allocated since tracing started are traced.
+        block_count = len(tracemalloc.take_snapshot().traces)
+    finally:
+        tracemalloc.stop()
+    return seconds, peak_size, block_count
+
+
+def measure(run_once):
+    """Returns a BenchmarkResult for a benchmark.
+
+    run_once: Called as run_once(trace) to set up the initial state and return
+              run_command(..., trace).
+    The time is the fastest of REPEAT_COUNT runs. Memory is measured in one more
+    run, since tracing allocations slows the command down.
+    """
+    fastest_time = min(run_once(False)[0] for _ in range(REPEAT_COUNT))
+    if tracemalloc is None:
+        return BenchmarkResult(fastest_time, None, None)
+    seconds, peak_size, block_count = run_once(True)
+    return BenchmarkResult(fastest_time, peak_size, block_count)
+
+
+def get_benchmarks():
+    """Returns an array of all the benchmarks to run."""
+    text = lines(100000)
+    many_cursors = cursors(text, 10)
+    return [
+        Benchmark("Copy 10k cursors", 'copy', text, many_cursors),
+        Benchmark("Cut 10k cursors", 'cut', text, many_cursors),
+        Benchmark("Delete 10k cursors", 'delete', text, many_cursors),
+        Benchmark("Paste 10k cursors", 'paste', text, many_cursors),
+        Benchmark("Paste reindent 10k cursors", 'paste', text, many_cursors,
+                  args={'reindent': True}),
+        Benchmark("Duplicate 10k cursors", 'duplicate', text, many_cursors),
+        Benchmark("Move up 10k cursors", 'move_up', text, many_cursors),
+        Benchmark("Move down 10k cursors", 'move_down', text, many_cursors),
+        Benchmark("Copy paragraph 10k cursors", 'copy', text, many_cursors,
+                  args={'mode': 'paragraph'}),
+        Benchmark("Copy whole buffer", 'copy', text,
+                  [sublime.Region(0, len(text))]),
+    ]
+
+
+def get_large_file_benchmarks(line_count):
+    """Returns an array of the benchmarks to run on the large file."""
+    size = line_count * LARGE_FILE_LINE_LENGTH
+    def benchmark(name, command, selection, args=None):
+        name = "{} {} cursors, {:.0f} MB".format(
+            name, len(selection), size / (1024 * 1024))
+        return LargeFileBenchmark(name, command, selection, args=args)
+    selection = large_file_cursors(line_count, LARGE_FILE_CURSOR_COUNT)
+    many_cursors = large_file_cursors(line_count, main.LINE_INDEX_MIN_REGIONS)
+    return [
+        benchmark("Copy", 'copy', selection),
+        benchmark("Cut", 'cut', selection),
+        benchmark("Delete", 'delete', selection),
+        benchmark("Paste", 'paste', selection),
+        benchmark("Paste reindent", 'paste', selection, args={'reindent': True}),
+        benchmark("Duplicate", 'duplicate', selection),
+        benchmark("Move up", 'move_up', selection),
+        benchmark("Move down", 'move_down', selection),
+        benchmark("Copy", 'copy', many_cursors),
+        benchmark("Cut", 'cut', many_cursors),
+        benchmark("Paste", 'paste', many_cursors),
+    ]
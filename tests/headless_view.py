@@ -0,0 +1,472 @@
+"""A view that isn't shown in Sublime Text, with its text backed by a file.
+
+Used by the benchmarks to run the commands on files that are too big to keep
+several copies of in memory. The file is memory-mapped and never modified.
+Edits are recorded in a piece table, so memory use only grows with the size of
+the edits, not the size of the file.
+
+The file is decoded as Latin-1, so that each byte is one character and points
+in the view are offsets in the file.
+"""
+
+import bisect
+import itertools
+import mmap
+
+import sublime
+
+
+# Large pieces of the file are read this many bytes at a time.
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# Ids for headless views. They are negative so they can't match a real view.
+_view_ids = itertools.count(-1, -1)
+
+
+class PieceTable:
+    """Text made of pieces of a memory-mapped file and of inserted strings.
+
+    Each piece is (source, start, length), where source is either the file or
+    an inserted string.
+    """
+
+    def __init__(self, file_map, size):
+        self.size = size
+        self._pieces = [(file_map, 0, size)] if size > 0 else []
+        # The start of each piece. Only the first len(_starts) are known; the
+        # rest are found as needed. Edits only invalidate the pieces after them,
+        # so editing from the end of the buffer backwards stays cheap.
+        self._starts = [0] if size > 0 else []
+
+    def _locate(self, point):
+        """Returns (index of the piece containing point, offset into it).
+
+        The end of the text is at (number of pieces, 0).
+        """
+        pieces = self._pieces
+        starts = self._starts
+        if point >= self.size:
+            return len(pieces), 0
+        last_end = starts[-1] + pieces[len(starts) - 1][2]
+        while last_end <= point:
+            starts.append(last_end)
+            last_end += pieces[len(starts) - 1][2]
+        index = bisect.bisect_right(starts, point) - 1
+        return index, point - starts[index]
+
+    @staticmethod
+    def _read(piece, begin, end):
+        """Returns the text of the piece from begin to end."""
+        source, start, length = piece
+        if isinstance(source, str):
+            return source[start + begin:start + end]
+        return source[start + begin:start + end].decode('latin-1')
+
+    def substr(self, begin, end):
+        """Returns the text from begin to end."""
+        begin = max(begin, 0)
+        end = min(end, self.size)
+        parts = []
+        index, offset = self._locate(begin)
+        remaining = end - begin
+        while remaining > 0:
+            piece = self._pieces[index]
+            part_end = min(piece[2], offset + remaining)
+            parts.append(self._read(piece, offset, part_end))
+            remaining -= part_end - offset
+            index += 1
+            offset = 0
+        return ''.join(parts)
+
+    def find(self, character, begin):
+        """Returns the first point at or after begin with character, or -1."""
+        index, offset = self._locate(begin)
+        piece_start = begin - offset
+        for source, start, length in self._pieces[index:]:
+            if not isinstance(source, str):
+                found = source.find(character.encode('latin-1'),
+                                    start + offset, start + length)
+            else:
+                found = source.find(character, start + offset, start + length)
+            if found >= 0:
+                return piece_start + found - start
+            piece_start += length
+            offset = 0
+        return -1
+
+    def rfind(self, character, end):
+        """Returns the last point before end with character, or -1."""
+        if end <= 0:
+            return -1
+        index, offset = self._locate(end - 1)
+        offset += 1
+        while index >= 0:
+            source, start, length = self._pieces[index]
+            if not isinstance(source, str):
+                found = source.rfind(character.encode('latin-1'),
+                                     start, start + offset)
+            else:
+                found = source.rfind(character, start, start + offset)
+            if found >= 0:
+                return self._starts[index] + found - start
+            index -= 1
+            if index >= 0:
+                offset = self._pieces[index][2]
+        return -1
+
+    def count(self, character, begin, end):
+        """Returns how many times character appears from begin to end."""
+        total = 0
+        for chunk_begin in range(begin, end, CHUNK_SIZE):
+            chunk_end = min(chunk_begin + CHUNK_SIZE, end)
+            total += self.substr(chunk_begin, chunk_end).count(character)
+        return total
+
+    def insert(self, point, text):
+        """Inserts text at point."""
+        if not text:
+            return
+        index, offset = self._locate(point)
+        new_piece = (text, 0, len(text))
+        if offset == 0:
+            self._pieces.insert(index, new_piece)
+        else:
+            source, start, length = self._pieces[index]
+            self._pieces[index:index + 1] = [
+                (source, start, offset),
+                new_piece,
+                (source, start + offset, length - offset),
+            ]
+        if not self._starts:
+            self._starts.append(0)
+        del self._starts[index + 1:]
+        self.size += len(text)
+
+    def erase(self, begin, end):
+        """Erases the text from begin to end."""
+        begin = max(begin, 0)
+        end = min(end, self.size)
+        if begin >= end:
+            return
+        first_index, first_offset = self._locate(begin)
+        last_index, last_offset = self._locate(end)
+        new_pieces = []
+        if first_offset > 0:
+            source, start, length = self._pieces[first_index]
+            new_pieces.append((source, start, first_offset))
+        if last_index < len(self._pieces) and last_offset > 0:
+            source, start, length = self._pieces[last_index]
+            new_pieces.append((source, start + last_offset, length - last_offset))
+            last_index += 1
+        self._pieces[first_index:last_index] = new_pieces
+        # The piece at first_index still starts at the same point, if it exists.
+        del self._starts[first_index + 1:]
+        if first_index >= len(self._pieces):
+            del self._starts[first_index:]
+        self.size -= end - begin
+
+
+class HeadlessSelection:
+    """The selection of a HeadlessView, behaving like sublime.Selection.
+
+    Regions are kept sorted, and overlapping regions are merged.
+    """
+
+    def __init__(self):
+        self._regions = []
+
+    def __len__(self):
+        return len(self._regions)
+
+    def __getitem__(self, index):
+        return self._regions[index]
+
+    def __iter__(self):
+        return iter(list(self._regions))
+
+    def clear(self):
+        self._regions = []
+
+    def add(self, region):
+        region = sublime.Region(region.a, region.b)
+        index = self._first_ending_after(region.begin() - 1)
+        end_index = index
+        while (end_index < len(self._regions) and
+               self._regions[end_index].begin() <= region.end()):
+            end_index += 1
+        regions = self._regions[index:end_index] + [region]
+        regions.sort()
+        self._regions[index:end_index] = self._merged(regions)
+
+    def add_all(self, regions):
+        self._regions.extend(sublime.Region(region.a, region.b) for region in regions)
+        self._regions.sort()
+        self._regions = self._merged(self._regions)
+
+    def contains(self, region):
+        return any(selected.contains(region) for selected in self._regions)
+
+    def subtract(self, region):
+        begin = region.begin()
+        end = region.end()
+        index = self._first_ending_after(begin - 1)
+        end_index = index
+        remaining_regions = []
+        for selected in self._regions[index:]:
+            if selected.begin() > end:
+                break
+            end_index += 1
+            if selected.empty():
+                # Cursors touching either end of the region are removed too.
+                if not begin <= selected.a <= end:
+                    remaining_regions.append(selected)
+                continue
+            if selected.end() <= begin or selected.begin() >= end:
+                remaining_regions.append(selected)
+                continue
+            if selected.begin() < begin:
+                remaining_regions.append(sublime.Region(selected.begin(), begin))
+            if selected.end() > end:
+                remaining_regions.append(sublime.Region(end, selected.end()))
+        self._regions[index:end_index] = remaining_regions
+
+    def _first_ending_after(self, point):
+        """Returns the index of the first region that ends after point.
+
+        The regions are sorted and don't overlap, so their ends are sorted too.
+        """
+        low = 0
+        high = len(self._regions)
+        while low < high:
+            middle = (low + high) // 2
+            if self._regions[middle].end() <= point:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    @staticmethod
+    def _merged(regions):
+        """Returns the sorted regions with overlapping ones merged.
+
+        Touching regions are merged too, unless one of them is a cursor at the
+        end of the other.
+        """
+        merged_regions = []
+        for region in regions:
+            if merged_regions:
+                last_region = merged_regions[-1]
+                touching = (region.begin() == last_region.end() and
+                            not region.empty() and not last_region.empty())
+                if (region.begin() < last_region.end() or touching or
+                        region.begin() == last_region.begin()):
+                    merged_regions[-1] = last_region.cover(region)
+                    continue
+            merged_regions.append(region)
+        return merged_regions
+
+    def _shift(self, begin, end, new_end):
+        """Moves the regions after text from begin to end is replaced.
+
+        Points inside the replaced text move to begin; points after it move
+        by the change in size. Only the regions from begin onwards are touched,
+        so edits made from the end of the buffer backwards stay cheap.
+        """
+        shift = new_end - end
+        def move(point):
+            if point <= begin:
+                return point
+            if point < end:
+                return begin
+            return point + shift
+        # Include the region before begin, in case a moved region now touches it.
+        index = max(self._first_ending_after(begin) - 1, 0)
+        # Regions starting after end keep their order and spacing, so only the
+        # regions up to the first of them can need merging.
+        end_index = index
+        while (end_index < len(self._regions) and
+               self._regions[end_index].begin() <= end):
+            end_index += 1
+        regions = [sublime.Region(move(region.a), move(region.b))
+                   for region in self._regions[index:end_index + 1]]
+        later_regions = [sublime.Region(region.a + shift, region.b + shift)
+                         for region in self._regions[end_index + 1:]]
+        self._regions[index:] = self._merged(regions) + later_regions
+
+
+class HeadlessView:
+    """Emulates the parts of sublime.View that the commands use.
+
+    Edits are made directly, so edit arguments are ignored.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._file.seek(0, 2)
+        size = self._file.tell()
+        self._map = None
+        if size > 0:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._text = PieceTable(self._map, size)
+        self._selection = HeadlessSelection()
+        self._change_count = 0
+        self._id = next(_view_ids)
+        # (change count, point, row) of the last rowcol call. Rows are counted
+        # from here when possible, since points are usually looked up in order.
+        self._row_checkpoint = (0, 0, 0)
+
+    def close(self):
+        """Releases the file. The view can't be used afterwards."""
+        self._text = None
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+    def id(self):
+        return self._id
+
+    def is_valid(self):
+        return self._text is not None
+
+    def change_count(self):
+        return self._change_count
+
+    def sel(self):
+        return self._selection
+
+    def size(self):
+        return self._text.size
+
+    def substr(self, x):
+        if isinstance(x, sublime.Region):
+            return self._text.substr(x.begin(), x.end())
+        return self._text.substr(x, x + 1)
+
+    def line(self, x):
+        if isinstance(x, sublime.Region):
+            begin, end = x.begin(), x.end()
+        else:
+            begin = end = x
+        line_end = self._text.find('\n', end)
+        if line_end < 0:
+            line_end = self._text.size
+        return sublime.Region(self._text.rfind('\n', begin) + 1, line_end)
+
+    def full_line(self, x):
+        line = self.line(x)
+        return sublime.Region(line.a, min(line.b + 1, self._text.size))
+
+    def lines(self, region):
+        lines = []
+        line = self.line(region.begin())
+        while True:
+            lines.append(line)
+            if line.end() >= region.end() or line.end() >= self._text.size:
+                return lines
+            line = self.line(line.end() + 1)
+
+    def rowcol(self, point):
+        change_count, checkpoint, row = self._row_checkpoint
+        if change_count != self._change_count or checkpoint > point:
+            checkpoint = row = 0
+        row += self._text.count('\n', checkpoint, point)
+        self._row_checkpoint = (self._change_count, point, row)
+        line_begin = self._text.rfind('\n', point) + 1
+        return row, point - line_begin
+
+    def insert(self, edit, point, text):
+        self._text.insert(point, text)
+        self._change_count += 1
+        # Cursors at point move to after the inserted text.
+        self._selection._shift(point - 1, point - 1, point - 1 + len(text))
+        return len(text)
+
+    def erase(self, edit, region):
+        begin = max(region.begin(), 0)
+        end = min(region.end(), self._text.size)
+        self._text.erase(begin, end)
+        self._change_count += 1
+        self._selection._shift(begin, end, begin)
+
+    def replace(self, edit, region, text):
+        begin = region.begin()
+        end = region.end()
+        self._text.erase(begin, end)
+        self._text.insert(begin, text)
+        self._change_count += 1
+        self._selection._shift(begin, end, begin + len(text))
+
+    def run_command(self, command, args=None):
+        """Runs one of the built-in commands that the commands fall back to.
+
+        Only copy, cut, paste, and duplicate_line are emulated. Paste doesn't
+        track whether the clipboard came from copying whole lines, so it always
+        pastes at the selection.
+        """
+        commands = {
+            'copy': self._copy,
+            'cut': self._cut,
+            'paste': self._paste,
+            'duplicate_line': self._duplicate_line,
+        }
+        if command not in commands:
+            raise NotImplementedError(
+                "Can't run {!r} in a headless view".format(command))
+        commands[command](**(args or {}))
+
+    def _copied_regions(self):
+        """Returns (regions, separator) for the text that copy and cut take.
+
+        These are the selected regions, or the full lines of the cursors if
+        nothing is selected.
+        """
+        regions = [region for region in self._selection if not region.empty()]
+        if regions:
+            return regions, '\n'
+        lines = []
+        for region in self._selection:
+            line = self.full_line(region)
+            if not lines or lines[-1] != line:
+                lines.append(line)
+        return lines, ''
+
+    def _copy(self):
+        regions, separator = self._copied_regions()
+        if regions:
+            sublime.set_clipboard(separator.join(self.substr(region)
+                                                 for region in regions))
+        return regions
+
+    def _cut(self):
+        for region in reversed(self._copy()):
+            self.erase(None, region)
+
+    def _paste(self):
+        text = sublime.get_clipboard().replace('\r\n', '\n')
+        regions = list(self._selection)
+        # A line for each selection is pasted into each selection separately.
+        texts = text.split('\n')
+        if len(regions) < 2 or len(texts) != len(regions):
+            texts = [text] * len(regions)
+        for region, region_text in reversed(list(zip(regions, texts))):
+            self.replace(None, region, region_text)
+        # Leave a cursor after each pasted text.
+        self._selection.clear()
+        shift = 0
+        cursors = []
+        for region, region_text in zip(regions, texts):
+            shift += len(region_text)
+            cursors.append(sublime.Region(region.begin() + shift))
+            shift -= region.size()
+        self._selection.add_all(cursors)
+
+    def _duplicate_line(self):
+        # The same as Sublime Text's duplicate_line command. Each region moves
+        # past the text inserted before it, so look them up as they change.
+        for index in range(len(self._selection)):
+            region = self._selection[index]
+            if region.empty():
+                line = self.line(region)
+                self.insert(None, line.begin(), self.substr(line) + '\n')
+            else:
+                self.insert(None, region.begin(), self.substr(region))
@@ -0,0 +1,52 @@
+"""Tests for comparing benchmark results to the memory baseline."""
+
+import os
+import tempfile
+from .benchmarks import (BenchmarkResult, format_result, get_regressions,
+                         load_baseline, save_baseline)
+
+
+def test_get_regressions():
+    """Benchmarks: regressions beyond the threshold"""
+    baseline_result = {'peak_size': 1000, 'block_count': 10}
+    assert get_regressions(BenchmarkResult(1, 1200, 12), baseline_result, 0.2) == []
+    assert get_regressions(BenchmarkResult(1, 1201, 12), baseline_result, 0.2) == [
+        "peak +20%"]
+    assert get_regressions(BenchmarkResult(1, 2000, 20), baseline_result, 0.5) == [
+        "peak +100%", "blocks +100%"]
+    # A baseline of zero allows some growth.
+    assert get_regressions(BenchmarkResult(1, 1, 1),
+                           {'peak_size': 0, 'block_count': 0}, 0.2) == []
+    # Measurements that are missing from either side aren't compared.
+    assert get_regressions(BenchmarkResult(1, None, None), baseline_result, 0.2) == []
+    assert get_regressions(BenchmarkResult(1, 5000, 50), {}, 0.2) == []
+
+
+def test_format_result():
+    """Benchmarks: result lines"""
+    result = BenchmarkResult(0.5, 4096, 12)
+    baseline_result = {'peak_size': 4096, 'block_count': 10}
+    line = format_result("Copy", result, baseline_result, 0.5)
+    assert line.startswith("    Copy") and "500.00 ms" in line, line
+    assert "4 KB peak" in line and "FAIL" not in line, line
+    line = format_result("Copy", result, baseline_result, 0.1)
+    assert line.endswith("FAIL - blocks +20%\n"), line
+    line = format_result("Copy", result, None, 0.1)
+    assert line.endswith("no baseline\n"), line
+    # Without tracemalloc, only the time is shown.
+    line = format_result("Copy", BenchmarkResult(0.5, None, None), None, 0.1)
+    assert line.endswith("500.00 ms\n"), line
+
+
+def test_save_baseline():
+    """Benchmarks: saving merges into the baseline"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'baseline.json')
+        assert load_baseline(path) == {}
+        save_baseline(path, {}, {'Copy': BenchmarkResult(1, 100, 1),
+                                 'Cut': BenchmarkResult(1, 200, 2)})
+        save_baseline(path, load_baseline(path), {'Cut': BenchmarkResult(1, 300, 3)})
+        assert load_baseline(path) == {
+            'Copy': {'peak_size': 100, 'block_count': 1},
+            'Cut': {'peak_size': 300, 'block_count': 3},
+        }
@@ -6,50 +6,40 @@ To run the tests:
    window.run_command('ccpl_run_tests')
 """
 
-import sublime, sublime_plugin
+import sublime
+import importlib
 import operator
+import os
+import sys
+import tempfile
 import traceback
-CopyCutAndPasteLines = __import__('Copy Cut and Paste Lines.main')
-
-
-class CcplRunTestsCommand(sublime_plugin.WindowCommand):
-    """Run the tests and show them in a new tab."""
-
-    def description(self):
-        return "Run CutCopyPasteLines tests"
-
-    def run(self):
-        # Open a new buffer to show the test results in.
-        view = self.window.new_file()
-        view.set_scratch(True)
-        view.set_name("Test Results")
-        # Need to run a text command to edit the view.
-        view.run_command('ccpl_show_test_output')
-
-
-class CcplShowTestOutputCommand(sublime_plugin.TextCommand):
-    """Run the tests and show them in this tab."""
-
-    def description(self):
-        return "Run CutCopyPasteLines tests"
-
-    def run(self, edit):
-        view = self.view
-        tests = get_tests()
-        # Run the tests.
-        output = ""
-        pass_count = 0
-        for test in tests:
-            test_result = test.run(view, edit)
-            # Output Pass/Fail.
-            output += ("FAIL", "Pass")[test_result]
-            output += " - " + test.name + test.fail_message + "\n"
-            pass_count += test_result
-        output = "{} of {} tests passed.\n\n".format(pass_count, len(tests)) + output
-        # Show the output.
-        view.replace(edit, sublime.Region(0, view.size()), "")
-        view.insert(edit, 0, output)
-        view.sel().clear()
+from .. import main
+from ..ccpl.registers import RegisterStore
+
+
+# Modules with tests written as functions. Every function named test_* is run,
+# and fails if it raises an exception.
+TEST_MODULES = ['test_views', 'test_registers', 'test_line_index',
+                'test_headless_view', 'test_benchmarks']
+
+
+def show_test_output(view, edit):
+    """Run the tests and show them in view."""
+    tests = get_tests() + get_line_index_tests() + get_function_tests()
+    # Run the tests.
+    output = ""
+    pass_count = 0
+    for test in tests:
+        test_result = test.run(view, edit)
+        # Output Pass/Fail.
+        output += ("FAIL", "Pass")[test_result]
+        output += " - " + test.name + test.fail_message + "\n"
+        pass_count += test_result
+    output = "{} of {} tests passed.\n\n".format(pass_count, len(tests)) + output
+    # Show the output.
+    view.replace(edit, sublime.Region(0, view.size()), "")
+    view.insert(edit, 0, output)
+    view.sel().clear()
 
 
 def selections_equal(selection1, selection2):
@@ -65,6 +55,16 @@ def selections_equal(selection1, selection2):
     return True
 
 
+def get_fail_message():
+    """Returns the traceback of the exception being handled, for a test failure."""
+    fail_message = "\n" + traceback.format_exc()
+    # Trim down long file paths.
+    fail_message = fail_message.replace(sublime.packages_path(), 'Packages')
+    fail_message = fail_message.replace(
+        sublime.installed_packages_path(), 'Installed Packages')
+    return fail_message
+
+
 def cursor(position):
     """Returns a zero-width (cursor) selection at position."""
     return [sublime.Region(position, position)]
@@ -83,7 +83,9 @@ class Test:
     def __init__(
             self, name, command, initial_text, initial_selection,
             initial_clipboard='CLIPBOARD', correct_text=UNCHANGED,
-            correct_selection=UNCHANGED, correct_clipboard=UNCHANGED):
+            correct_selection=UNCHANGED, correct_clipboard=UNCHANGED,
+            args=None, initial_registers=None, correct_registers=UNCHANGED,
+            line_index=False):
         """Specifies all information needed to run the test.
 
         Args:
@@ -92,6 +94,12 @@ class Test:
                 -Use Test.UNCHANGED to mean that the value remain unchanged.
                 -Use Test.ANY to mean that any value is acceptable.
             initial_selection & correct_selection: Array of sublime.Region
+            args: Dictionary of arguments to pass to the command.
+            initial_registers & correct_registers: Dictionary of register names
+                to text. If initial_registers is given, the command uses a
+                temporary register store instead of the user's registers.
+            line_index: Whether the command uses the line index for every
+                selection, instead of only for large selections.
         """
         if correct_text == self.UNCHANGED:
             correct_text = initial_text
@@ -99,14 +107,20 @@ class Test:
             correct_selection = initial_selection
         if correct_clipboard == self.UNCHANGED:
             correct_clipboard = initial_clipboard
+        if correct_registers == self.UNCHANGED:
+            correct_registers = initial_registers
         self.name = name
         self.initial_text = initial_text
         self.initial_selection = initial_selection
         self.initial_clipboard = initial_clipboard
         self.command = command
+        self.args = args or {}
         self.correct_text = correct_text
         self.correct_selection = correct_selection
         self.correct_clipboard = correct_clipboard
+        self.initial_registers = initial_registers
+        self.correct_registers = correct_registers
+        self.line_index = line_index
         self.fail_message = ""
 
     def run(self, view, edit):
@@ -114,6 +128,29 @@ class Test:
 
         Sets self.fail_message if the test fails.
         """
+        # Put back anything that's swapped out for the test afterwards.
+        line_index_limits = (main.LINE_INDEX_MIN_REGIONS,
+                             main.LINE_INDEX_MAX_SIZE_PER_REGION)
+        register_store = main._register_store
+        try:
+            if self.line_index:
+                main.LINE_INDEX_MIN_REGIONS = 0
+                main.LINE_INDEX_MAX_SIZE_PER_REGION = sys.maxsize
+            if self.initial_registers is None:
+                return self._run(view, edit)
+            # Use a temporary register store instead of the user's.
+            with tempfile.TemporaryDirectory() as directory:
+                main._register_store = RegisterStore(
+                    os.path.join(directory, 'registers'))
+                for name, text in self.initial_registers.items():
+                    main._register_store.set(name, text)
+                return self._run(view, edit)
+        finally:
+            (main.LINE_INDEX_MIN_REGIONS,
+             main.LINE_INDEX_MAX_SIZE_PER_REGION) = line_index_limits
+            main._register_store = register_store
+
+    def _run(self, view, edit):
         # Initial state
         view.replace(edit, sublime.Region(0, view.size()), self.initial_text)
         sublime.set_clipboard(self.initial_clipboard)
@@ -124,18 +161,13 @@ class Test:
         try:
             # Call the command directly instead of using view.run_command, so
             # that errors can be caught and displayed.
-            class_name = 'Ccpl' + self.command.capitalize() + 'Command'
-            command_class = getattr(CopyCutAndPasteLines.main, class_name)
+            command_words = [word.capitalize() for word in self.command.split('_')]
+            class_name = 'Ccpl' + ''.join(command_words) + 'Command'
+            command_class = getattr(main, class_name)
             command_object = command_class(view)
-            command_object.run(edit)
+            command_object.run(edit, **self.args)
         except:
-            # Get the traceback message.
-            self.fail_message = "\n" + traceback.format_exc()
-            # Trim down long file paths.
-            self.fail_message = self.fail_message.replace(
-                sublime.packages_path(), 'Packages')
-            self.fail_message = self.fail_message.replace(
-                sublime.installed_packages_path(), 'Installed Packages')
+            self.fail_message = get_fail_message()
             return False # Fail due to an exception.
         end_text = view.substr(sublime.Region(0, view.size()))
         # Check that the end state matches the correct state.
@@ -144,7 +176,14 @@ class Test:
         pass_clipboard = self._test_value("clipboard", self.correct_clipboard,
                                           sublime.get_clipboard())
         pass_text = self._test_value("text", self.correct_text, end_text)
-        return pass_text and pass_clipboard and pass_selection
+        pass_registers = True
+        if self.initial_registers is not None:
+            register_store = main._register_store
+            registers = {name: register_store.get(name)
+                         for name in register_store.names()}
+            pass_registers = self._test_value("registers", self.correct_registers,
+                                              registers)
+        return pass_text and pass_clipboard and pass_selection and pass_registers
 
     def _test_value(self, name, correct_value, actual_value, equal=operator.eq):
         """Returns whether the value is correct.
@@ -164,6 +203,58 @@ class Test:
         return True # Pass.
 
 
+class FunctionTest:
+    """Runs a test function, which raises an exception if the test fails."""
+
+    def __init__(self, name, function):
+        self.name = name
+        self.function = function
+        self.fail_message = ""
+
+    def run(self, view, edit):
+        """Returns True for pass or False for fail.
+
+        Sets self.fail_message if the test fails.
+        """
+        try:
+            self.function()
+        except:
+            self.fail_message = get_fail_message()
+            return False
+        return True
+
+
+def get_function_tests():
+    """Returns a FunctionTest for each test function in TEST_MODULES.
+
+    Tests are named by the first line of the function's docstring, and run in
+    the order they are defined.
+    """
+    tests = []
+    for module_name in TEST_MODULES:
+        module = importlib.import_module('.' + module_name, __package__)
+        functions = [function for name, function in vars(module).items()
+                     if name.startswith('test_') and callable(function)]
+        functions.sort(key=lambda function: function.__code__.co_firstlineno)
+        for function in functions:
+            name = (function.__doc__ or function.__name__).strip().splitlines()[0]
+            tests.append(FunctionTest(name, function))
+    return tests
+
+
+def get_line_index_tests():
+    """Returns the command tests again, run using the line index.
+
+    The commands only use the line index for large selections, so the tests
+    lower the limits in main to use it for every selection.
+    """
+    tests = get_tests()
+    for test in tests:
+        test.name += " (line index)"
+        test.line_index = True
+    return tests
+
+
 def get_tests():
     """Returns an array of all the tests to run."""
     return [
@@ -306,6 +397,14 @@ def get_tests():
              command='paste',
              correct_text='line 1\nline 2\nline 4\nline 5\nline 3'
             ),
+        Test("Paste Windows line endings",
+             # The pasted lines should use \n like the rest of the buffer.
+             initial_text='line 1\nline 2\nline 3',
+             initial_selection=cursor(8),
+             initial_clipboard='line 4\r\nline 5\r\n',
+             command='paste',
+             correct_text='line 1\nline 2\nline 4\nline 5\nline 3'
+            ),
         Test("Duplicate multiline",
              # Selecting parts of lines should still duplicate the full lines.
              initial_text='line 1\nline 2\nline 3',
@@ -648,4 +747,284 @@ def get_tests():
              command='paste',
              correct_text='clip-line\nline 2'
             ),
+        Test("Empty buffer delete",
+             initial_text='',
+             initial_selection=cursor(0),
+             command='delete'
+            ),
+        Test("Delete word",
+             initial_text='line 1\nline 2',
+             initial_selection=region(0, 4),
+             command='delete',
+             correct_text=' 1\nline 2',
+             correct_selection=cursor(0)
+            ),
+        Test("Delete line",
+             # The clipboard should be left alone.
+             initial_text='line 1\nline 2\nline 3',
+             initial_selection=cursor(8),
+             command='delete',
+             correct_text='line 1\nline 3'
+            ),
+        Test("Delete multiline",
+             initial_text='line 1\nline 2\nline 3\nline 4',
+             initial_selection=region(8, 16),
+             command='delete',
+             correct_text='line 1\nline 4',
+             correct_selection=cursor(9)
+            ),
+        Test("Delete last line",
+             initial_text='line 1\nline 2',
+             initial_selection=cursor(8),
+             command='delete',
+             correct_text='line 1',
+             correct_selection=cursor(1)
+            ),
+        Test("Overlapping selections delete",
+             initial_text='line 1\nline 2\nline 3\nline 4',
+             initial_selection=region(1, 8) + region(12, 16),
+             command='delete',
+             correct_text='line 4',
+             correct_selection=cursor(1) + cursor(2)
+            ),
+        Test("Paragraph copy",
+             initial_text='line 1\nline 2\n\nline 4\nline 5\n\nline 7',
+             initial_selection=cursor(16),
+             command='copy',
+             args={'mode': 'paragraph'},
+             correct_clipboard='line 4\nline 5\n'
+            ),
+        Test("Paragraph copy word",
+             # Selections within a line still expand to the paragraph.
+             initial_text='line 1\nline 2\n\nline 4',
+             initial_selection=region(0, 4),
+             command='copy',
+             args={'mode': 'paragraph'},
+             correct_clipboard='line 1\nline 2\n'
+            ),
+        Test("Paragraph copy multiple selections",
+             initial_text='line 1\nline 2\n\nline 4\nline 5\n\nline 7',
+             initial_selection=cursor(1) + cursor(8) + cursor(31),
+             command='copy',
+             args={'mode': 'paragraph'},
+             correct_clipboard='line 1\nline 2\nline 7\n'
+            ),
+        Test("Paragraph cut",
+             initial_text='line 1\nline 2\n\nline 4\nline 5\n\nline 7',
+             initial_selection=cursor(16),
+             command='cut',
+             args={'mode': 'paragraph'},
+             correct_text='line 1\nline 2\n\n\nline 7',
+             correct_clipboard='line 4\nline 5\n',
+             correct_selection=cursor(15)
+            ),
+        Test("Paragraph duplicate",
+             initial_text='line 1\nline 2\n\nline 4',
+             initial_selection=cursor(1),
+             command='duplicate',
+             args={'mode': 'paragraph'},
+             correct_text='line 1\nline 2\nline 1\nline 2\n\nline 4'
+            ),
+        Test("Indentation copy",
+             initial_text='if a:\n\tline 2\n\n\tline 4\nline 5',
+             initial_selection=cursor(8),
+             command='copy',
+             args={'mode': 'indentation'},
+             correct_clipboard='\tline 2\n\n\tline 4\n'
+            ),
+        Test("Indentation copy nested",
+             initial_text='if a:\n\tif b:\n\t\tline 3\n\tline 4\nline 5',
+             initial_selection=cursor(16),
+             command='copy',
+             args={'mode': 'indentation'},
+             correct_clipboard='\t\tline 3\n'
+            ),
+        Test("Indentation copy overlapping blocks",
+             # The outer block contains the inner one, so it's only copied once.
+             initial_text='if a:\n\tif b:\n\t\tline 3\n\tline 4\nline 5',
+             initial_selection=cursor(16) + cursor(25),
+             command='copy',
+             args={'mode': 'indentation'},
+             correct_clipboard='\tif b:\n\t\tline 3\n\tline 4\n'
+            ),
+        Test("Paste reindent below",
+             initial_text='if a:\n\tline 2\nline 3',
+             initial_selection=cursor(8),
+             initial_clipboard='x = 1\n  y = 2\n',
+             command='paste',
+             args={'reindent': True},
+             correct_text='if a:\n\tline 2\n\tx = 1\n\t  y = 2\nline 3'
+            ),
+        Test("Paste reindent overwrite",
+             initial_text='line 1\n    line 2\n    line 3',
+             initial_selection=region(11, 16),
+             initial_clipboard='\tif a:\n\n\t\tb\n',
+             command='paste',
+             args={'reindent': True},
+             correct_text='line 1\n    if a:\n\n    \tb\n    line 3',
+             correct_selection=cursor(16)
+            ),
+        Test("Paste reindent multiple levels",
+             initial_text='a\n\tb\n\t\tc',
+             initial_selection=cursor(0) + cursor(3) + cursor(7),
+             initial_clipboard='  x\n',
+             command='paste',
+             args={'reindent': True},
+             correct_text='a\nx\n\tb\n\tx\n\t\tc\n\t\tx',
+             correct_selection=cursor(0) + cursor(5) + cursor(12)
+            ),
+        Test("Box selection copy",
+             initial_text='line 1\nline 2\nline 3',
+             initial_selection=region(1, 3) + region(8, 10),
+             command='copy',
+             correct_clipboard='in\nin'
+            ),
+        Test("Box selection cut",
+             initial_text='line 1\nline 2\nline 3',
+             initial_selection=region(1, 3) + region(8, 10),
+             command='cut',
+             correct_text='le 1\nle 2\nline 3',
+             correct_clipboard='in\nin',
+             correct_selection=cursor(1) + cursor(6)
+            ),
+        Test("Box selection cut with short line",
+             # The box is cut off at the end of the short middle line.
+             initial_text='line 1\nab\nline 3',
+             initial_selection=region(3, 5) + cursor(9) + region(13, 15),
+             command='cut',
+             correct_text='lin1\nab\nlin3',
+             correct_clipboard=Test.ANY,
+             correct_selection=Test.ANY
+            ),
+        Test("Full lines are not a box selection",
+             initial_text='line 1\nline 2\nline 3',
+             initial_selection=region(0, 6) + region(7, 13),
+             command='copy',
+             correct_clipboard='line 1\nline 2\n'
+            ),
+        Test("Non-consecutive lines are not a box selection",
+             initial_text='line 1\nline 2\nline 3',
+             initial_selection=region(1, 3) + region(15, 17),
+             command='copy',
+             correct_clipboard='line 1\nline 3\n'
+            ),
+        Test("Register copy",
+             # Registers hold full lines, even for a selection within a line.
+             initial_text='line 1\nline 2\nline 3',
+             initial_selection=region(7, 9),
+             command='copy',
+             args={'register': 'a'},
+             initial_registers={},
+             correct_registers={'a': 'line 2\n'}
+            ),
+        Test("Register paste",
+             initial_text='line 1\nline 3',
+             initial_selection=cursor(1),
+             command='paste',
+             args={'register': 'a'},
+             initial_registers={'a': 'line 2\n'},
+             correct_text='line 1\nline 2\nline 3'
+            ),
+        Test("Register cut",
+             initial_text='line 1\nline 2\nline 3',
+             initial_selection=cursor(1),
+             command='cut',
+             args={'register': 'a'},
+             initial_registers={'a': 'old\n'},
+             correct_text='line 2\nline 3',
+             correct_registers={'a': 'line 1\n'}
+            ),
+        Test("Register paste overwrite",
+             initial_text='line 2\nline 3',
+             initial_selection=region(7, 9),
+             command='paste',
+             args={'register': 'a'},
+             initial_registers={'a': 'line 1\n'},
+             correct_text='line 2\nline 1',
+             correct_selection=cursor(9)
+            ),
+        Test("Empty register paste",
+             # Nothing is pasted, not even the clipboard.
+             initial_text='line 1',
+             initial_selection=cursor(1),
+             command='paste',
+             args={'register': 'a'},
+             initial_registers={'b': 'line 2\n'}
+            ),
+        Test("Move line up",
+             initial_text='line 1\nline 2\nline 3',
+             initial_selection=cursor(8),
+             command='move_up',
+             correct_text='line 2\nline 1\nline 3',
+             correct_selection=cursor(1)
+            ),
+        Test("Move line down",
+             initial_text='line 1\nline 2\nline 3',
+             initial_selection=cursor(1),
+             command='move_down',
+             correct_text='line 2\nline 1\nline 3',
+             correct_selection=cursor(8)
+            ),
+        Test("Move first line up",
+             initial_text='line 1\nline 2',
+             initial_selection=cursor(1),
+             command='move_up'
+            ),
+        Test("Move last line down",
+             initial_text='line 1\nline 2',
+             initial_selection=cursor(8),
+             command='move_down'
+            ),
+        Test("Move last line up",
+             initial_text='line 1\nline 2',
+             initial_selection=cursor(13),
+             command='move_up',
+             correct_text='line 2\nline 1',
+             correct_selection=cursor(6)
+            ),
+        Test("Move multiline up",
+             initial_text='line 1\nline 2\nline 3\nline 4',
+             initial_selection=region(8, 16),
+             command='move_up',
+             correct_text='line 2\nline 3\nline 1\nline 4',
+             correct_selection=region(1, 9)
+            ),
+        Test("Move multiple selections up",
+             initial_text='line 1\nline 2\nline 3\nline 4',
+             initial_selection=cursor(8) + cursor(22),
+             command='move_up',
+             correct_text='line 2\nline 1\nline 4\nline 3',
+             correct_selection=cursor(1) + cursor(15)
+            ),
+        Test("Move separate selections down",
+             # The lines between the moved blocks are left where they are.
+             initial_text='line 1\nline 2\nline 3\nline 4\nline 5\nline 6',
+             initial_selection=cursor(1) + cursor(22),
+             command='move_down',
+             correct_text='line 2\nline 1\nline 3\nline 5\nline 4\nline 6',
+             correct_selection=cursor(8) + cursor(29)
+            ),
+        Test("Move adjacent selections down",
+             # Selections on touching lines move together as one block.
+             initial_text='line 1\nline 2\nline 3',
+             initial_selection=cursor(1) + cursor(8),
+             command='move_down',
+             correct_text='line 3\nline 1\nline 2',
+             correct_selection=cursor(8) + cursor(15)
+            ),
+        Test("Move blocked and unblocked selections up",
+             # The first line can't move, but the third line still can.
+             initial_text='line 1\nline 2\nline 3\nline 4',
+             initial_selection=cursor(1) + cursor(15),
+             command='move_up',
+             correct_text='line 1\nline 3\nline 2\nline 4',
+             correct_selection=cursor(1) + cursor(8)
+            ),
+        Test("Move down with trailing newline",
+             initial_text='line 1\nline 2\n',
+             initial_selection=cursor(8),
+             command='move_down',
+             correct_text='line 1\n\nline 2',
+             correct_selection=cursor(9)
+            ),
     ]
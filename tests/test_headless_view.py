@@ -0,0 +1,166 @@
+"""Tests for the headless view the benchmarks use.
+
+Random edits are made to a HeadlessView, and to a plain string and list of
+regions, and the two are compared after each edit.
+"""
+
+import os
+import random
+import sublime
+import tempfile
+from . import headless_view
+from .headless_view import HeadlessSelection, HeadlessView
+
+
+# Characters for random text, including one that Latin-1 encodes as one byte
+# but UTF-8 doesn't.
+CHARACTERS = ['a', 'b', ' ', '\n', 'é']
+
+
+class HeadlessViewModel:
+    """A HeadlessView on a temporary file, with a model of its text and selection."""
+
+    def __init__(self, generator, text):
+        self.generator = generator
+        file_descriptor, self.path = tempfile.mkstemp()
+        with os.fdopen(file_descriptor, 'wb') as text_file:
+            text_file.write(text.encode('latin-1'))
+        self.view = HeadlessView(self.path)
+        self.text = text
+        self.regions = []
+
+    def close(self):
+        self.view.close()
+        os.remove(self.path)
+
+    def random_text(self):
+        return ''.join(self.generator.choice(CHARACTERS)
+                       for _ in range(self.generator.randint(0, 5)))
+
+    def random_region(self):
+        a = self.generator.randint(0, len(self.text))
+        if self.generator.random() < 0.3:
+            return sublime.Region(a)
+        return sublime.Region(a, self.generator.randint(0, len(self.text)))
+
+    def select(self, region):
+        self.view.sel().add(region)
+        self.regions = merged(self.regions + [region])
+
+    def edit(self):
+        """Makes a random edit to the view and the model."""
+        region = self.random_region()
+        begin, end = region.begin(), region.end()
+        text = self.random_text()
+        operation = self.generator.choice(['insert', 'erase', 'replace'])
+        if operation == 'insert':
+            self.view.insert(None, begin, text)
+            end = begin
+        elif operation == 'erase':
+            self.view.erase(None, region)
+            text = ''
+        else:
+            self.view.replace(None, region, text)
+        def move(point):
+            # Points at an insertion move after the inserted text.
+            if point < begin or (point == begin and operation != 'insert'):
+                return point
+            if point < end:
+                return begin
+            return point + len(text) - (end - begin)
+        self.text = self.text[:begin] + text + self.text[end:]
+        self.regions = merged([sublime.Region(move(region.a), move(region.b))
+                               for region in self.regions])
+        return operation, region, text
+
+    def check(self, description):
+        """Raises AssertionError if the view doesn't match the model."""
+        view = self.view
+        text = self.text
+        assert view.size() == len(text), description
+        assert view.substr(sublime.Region(0, view.size())) == text, description
+        assert list(view.sel()) == self.regions, "{}: expected {!r}, received {!r}".format(
+            description, self.regions, list(view.sel()))
+        for _ in range(5):
+            point = self.generator.randint(0, len(text))
+            line_begin = text.rfind('\n', 0, point) + 1
+            line_end = text.find('\n', point)
+            if line_end < 0:
+                line_end = len(text)
+            assert view.line(point) == sublime.Region(line_begin, line_end), description
+            assert view.rowcol(point) == (text.count('\n', 0, point),
+                                          point - line_begin), description
+            assert view.substr(point) == text[point:point + 1], description
+            region = self.random_region()
+            assert view.substr(region) == text[region.begin():region.end()], description
+
+
+def merged(regions):
+    """Returns the regions sorted and merged, the way a selection keeps them."""
+    return HeadlessSelection._merged(sorted(regions))
+
+
+def test_random_edits():
+    """Headless view: random edits match a plain string"""
+    generator = random.Random(0)
+    chunk_size = headless_view.CHUNK_SIZE
+    # Count lines a few characters at a time, so lines are split between chunks.
+    headless_view.CHUNK_SIZE = 3
+    try:
+        for _ in range(20):
+            text = ''.join(generator.choice(CHARACTERS)
+                           for _ in range(generator.randint(0, 40)))
+            model = HeadlessViewModel(generator, text)
+            try:
+                for _ in range(generator.randint(0, 5)):
+                    model.select(model.random_region())
+                model.check("initial text {!r}".format(text))
+                for _ in range(30):
+                    operation, region, inserted_text = model.edit()
+                    model.check("{} {!r} {!r}".format(operation, region, inserted_text))
+            finally:
+                model.close()
+    finally:
+        headless_view.CHUNK_SIZE = chunk_size
+
+
+def test_native_commands():
+    """Headless view: copy, cut, paste, and duplicate_line"""
+    cases = [
+        # command, text, selection, clipboard, correct text, correct selection,
+        # correct clipboard
+        ('copy', 'line 1\nline 2', [(0, 4), (7, 11)], '',
+         'line 1\nline 2', [(0, 4), (7, 11)], 'line\nline'),
+        ('copy', 'line 1\nline 2', [(1,), (3,)], '',
+         'line 1\nline 2', [(1,), (3,)], 'line 1\n'),
+        ('cut', 'line 1\nline 2', [(0, 5), (7, 12)], '',
+         '1\n2', [(0,), (2,)], 'line \nline '),
+        ('cut', 'line 1\nline 2\n', [(8,)], '',
+         'line 1\n', [(7,)], 'line 2\n'),
+        ('paste', 'line 1\nline 2', [(0, 4), (7,)], 'word',
+         'word 1\nwordline 2', [(4,), (11,)], 'word'),
+        # One line of the clipboard for each selection.
+        ('paste', 'ab\ncd', [(1,), (4,)], 'X\nY',
+         'aXb\ncYd', [(2,), (6,)], 'X\nY'),
+        ('duplicate_line', 'line 1\nline 2', [(0, 4), (7,)], '',
+         'lineline 1\nline 2\nline 2', [(4, 8), (18,)], ''),
+    ]
+    for command, text, selection, clipboard, correct_text, correct_selection, \
+            correct_clipboard in cases:
+        file_descriptor, path = tempfile.mkstemp()
+        with os.fdopen(file_descriptor, 'wb') as text_file:
+            text_file.write(text.encode('latin-1'))
+        view = HeadlessView(path)
+        try:
+            view.sel().add_all(sublime.Region(*region) for region in selection)
+            sublime.set_clipboard(clipboard)
+            view.run_command(command)
+            description = "{} {!r} {!r}".format(command, text, selection)
+            assert view.substr(sublime.Region(0, view.size())) == correct_text, \
+                description
+            assert list(view.sel()) == [sublime.Region(*region)
+                                        for region in correct_selection], description
+            assert sublime.get_clipboard() == correct_clipboard, description
+        finally:
+            view.close()
+            os.remove(path)
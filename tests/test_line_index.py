@@ -0,0 +1,219 @@
+"""Tests that the line index gives the same results with and without NumPy.
+
+Each result is also compared to one worked out directly from the text. If NumPy
+isn't available, both backends are pure Python, so only that comparison counts.
+Expanding a few regions without the index is compared to the index as well.
+"""
+
+import random
+import sublime
+import sys
+from .. import main
+from ..ccpl import line_index
+from ..ccpl.line_index import LineIndex, find_line_starts
+from .test_views import close_views, new_scratch_view
+
+
+# Texts to index, including characters that aren't in Latin-1, blank lines, and
+# indented blocks.
+TEXTS = [
+    '',
+    '\n',
+    'one line',
+    'line 1\nline 2\n',
+    '\n\nline 3\n\n',
+    'ünï\n€uro\n\t😀 emoji\nend',
+    'def a():\n    b = 1\n\n    if b:\n        c()\n\nd = 2\n',
+]
+
+
+def get_texts():
+    """Returns TEXTS, plus random texts made from the same characters."""
+    generator = random.Random(0)
+    texts = list(TEXTS)
+    for _ in range(20):
+        texts.append(''.join(generator.choice(['a', ' ', '\t', '\n', '\n\n', '€'])
+                             for _ in range(generator.randint(1, 60))))
+    return texts
+
+
+def get_line_indexes(text):
+    """Returns (NumPy LineIndex, pure Python LineIndex) for text.
+
+    The text is read a few characters at a time, so that lines are split
+    between chunks.
+    """
+    def read(begin, end):
+        return text[begin:end]
+    chunk_size = line_index.CHUNK_SIZE
+    line_index.CHUNK_SIZE = 3
+    try:
+        line_indexes = (LineIndex(read, len(text), use_numpy=True),
+                        LineIndex(read, len(text), use_numpy=False))
+        for index in line_indexes:
+            index.index_blocks()
+    finally:
+        line_index.CHUNK_SIZE = chunk_size
+    return line_indexes
+
+
+def assert_equal(name, value, correct_value):
+    """Raises AssertionError if value is not correct_value."""
+    assert value == correct_value, "{}: expected {!r}, received {!r}".format(
+        name, correct_value, value)
+
+
+def test_find_line_starts():
+    """Line index: find_line_starts with and without NumPy"""
+    for text in get_texts():
+        correct_starts = [offset + 5 + 1 for offset, character in enumerate(text)
+                          if character == '\n']
+        for use_numpy in (True, False):
+            starts = find_line_starts(text, 5, use_numpy)
+            assert_equal(repr(text), [int(start) for start in starts], correct_starts)
+
+
+def test_rowcols():
+    """Line index: rowcols with and without NumPy"""
+    for text in get_texts():
+        points = list(range(len(text) + 1))
+        correct_rows = [text.count('\n', 0, point) for point in points]
+        correct_columns = [point - text.rfind('\n', 0, point) - 1 for point in points]
+        for index in get_line_indexes(text):
+            rows, columns = index.rowcols(points)
+            assert_equal(repr(text), (list(rows), list(columns)),
+                         (correct_rows, correct_columns))
+            assert_equal(repr(text), [index.row(point) for point in points],
+                         correct_rows)
+
+
+def test_full_lines():
+    """Line index: full_lines with and without NumPy"""
+    generator = random.Random(1)
+    for text in get_texts():
+        regions = []
+        for _ in range(10):
+            begin = generator.randint(0, len(text))
+            regions.append(sublime.Region(begin, generator.randint(begin, len(text))))
+        correct_lines = []
+        for region in regions:
+            begin = text.rfind('\n', 0, region.begin()) + 1
+            end = text.find('\n', region.end())
+            correct_lines.append((begin, len(text) if end < 0 else end + 1))
+        for index in get_line_indexes(text):
+            lines = [(int(begin), int(end)) for begin, end in index.full_lines(regions)]
+            assert_equal(repr(text), lines, correct_lines)
+
+
+def test_expand():
+    """Line index: expand and is_box with and without NumPy"""
+    generator = random.Random(2)
+    for text in get_texts():
+        numpy_index, python_index = get_line_indexes(text)
+        assert_equal(repr(text), numpy_index.blank, python_index.blank)
+        assert_equal(repr(text), numpy_index.indents, python_index.indents)
+        for _ in range(20):
+            begin = generator.randint(0, len(text))
+            end = generator.randint(begin, len(text))
+            for mode in line_index.MODES:
+                assert_equal(repr(text) + ' ' + mode,
+                             numpy_index.expand(begin, end, mode),
+                             python_index.expand(begin, end, mode))
+        # Boxes, or nearly boxes, on the first rows.
+        starts = [int(start) for start in python_index.starts]
+        for row_count in range(2, len(starts) + 1):
+            column = generator.randint(0, 2)
+            regions = []
+            for row in range(row_count):
+                row_end = python_index.line_end(row)
+                begin = min(starts[row] + column, row_end)
+                regions.append(sublime.Region(begin, min(begin + 2, row_end)))
+            assert_equal(repr(text), numpy_index.is_box(regions),
+                         python_index.is_box(regions))
+
+
+def test_index_rows():
+    """Line index: is_box with an index of only the selected rows"""
+    generator = random.Random(4)
+    for text in get_texts():
+        def read(begin, end):
+            return text[begin:end]
+        index = get_line_indexes(text)[1]
+        starts = [int(start) for start in index.starts]
+        for first_row in range(len(starts) - 1):
+            end_row = generator.randint(first_row + 2, len(starts))
+            column = generator.randint(0, 2)
+            regions = []
+            for row in range(first_row, end_row):
+                row_end = index.line_end(row)
+                begin = min(starts[row] + column, row_end)
+                regions.append(sublime.Region(begin, min(begin + 2, row_end)))
+            for use_numpy in (True, False):
+                rows_index = LineIndex(read, index.line_end(end_row - 1),
+                                       use_numpy=use_numpy, begin=starts[first_row])
+                assert_equal(repr(text), rows_index.is_box(regions),
+                             index.is_box(regions))
+
+
+def test_use_line_index():
+    """Line index: only used for enough regions for the size of the buffer"""
+    class SizedView:
+        def __init__(self, size):
+            self._size = size
+
+        def size(self):
+            return self._size
+
+    region_count = main.LINE_INDEX_MIN_REGIONS
+    max_size = region_count * main.LINE_INDEX_MAX_SIZE_PER_REGION
+    assert main.use_line_index(SizedView(max_size), region_count)
+    assert not main.use_line_index(SizedView(max_size + 1), region_count)
+    assert not main.use_line_index(SizedView(0), region_count - 1)
+
+
+def test_index_discarded():
+    """Line index: dropped once each command is done with it"""
+    line_index_limits = (main.LINE_INDEX_MIN_REGIONS,
+                         main.LINE_INDEX_MAX_SIZE_PER_REGION)
+    main.LINE_INDEX_MIN_REGIONS = 0
+    main.LINE_INDEX_MAX_SIZE_PER_REGION = sys.maxsize
+    sublime.set_clipboard('line\n')
+    view = new_scratch_view('', [])
+    target_view = new_scratch_view('', [])
+    try:
+        commands = [
+            ('ccpl_copy', {}), ('ccpl_copy', {'mode': 'paragraph'}),
+            ('ccpl_copy', {'mode': 'indentation'}), ('ccpl_cut', {}),
+            ('ccpl_delete', {}), ('ccpl_paste', {}), ('ccpl_duplicate', {}),
+            ('ccpl_move_up', {}), ('ccpl_move_down', {}),
+            ('ccpl_send_lines_to_view', {'view_id': target_view.id()}),
+        ]
+        for command, args in commands:
+            view.run_command('append', {'characters': 'a\n  b\n\nc\n'})
+            view.sel().clear()
+            view.sel().add_all([sublime.Region(0), sublime.Region(3)])
+            view.run_command(command, args)
+            assert line_index._cached_index is None, command
+    finally:
+        close_views([view, target_view])
+        (main.LINE_INDEX_MIN_REGIONS,
+         main.LINE_INDEX_MAX_SIZE_PER_REGION) = line_index_limits
+
+
+def test_expand_without_index():
+    """Line index: expanding to blocks without the index"""
+    generator = random.Random(3)
+    for text in get_texts():
+        python_index = get_line_indexes(text)[1]
+        view = new_scratch_view(text, [])
+        try:
+            for _ in range(20):
+                begin = generator.randint(0, len(text))
+                end = generator.randint(begin, len(text))
+                for mode in (line_index.PARAGRAPH, line_index.INDENTATION):
+                    region = main.expand_to_block(view, sublime.Region(begin, end), mode)
+                    assert_equal("{!r} {} {}-{}".format(text, mode, begin, end),
+                                 (region.begin(), region.end()),
+                                 python_index.expand(begin, end, mode))
+        finally:
+            close_views([view])
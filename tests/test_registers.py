@@ -0,0 +1,165 @@
+"""Tests for the register store, using a temporary file."""
+
+import os
+import tempfile
+from ..ccpl import registers
+from ..ccpl.registers import RegisterStore
+
+
+class StoreSettingDuringCompact(RegisterStore):
+    """Sets a register part way through compacting, as another thread could.
+
+    Set pending_set to (name, text) before calling compact().
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.pending_set = None
+
+    def _record_size(self, record):
+        if self.pending_set is not None and not self._lock.locked():
+            name, text = self.pending_set
+            self.pending_set = None
+            self.set(name, text)
+        return RegisterStore._record_size(record)
+
+
+class StoreFailingToCompact(RegisterStore):
+    """Fails part way through copying the records, as a full disk could."""
+
+    def _record_size(self, record):
+        if self._compact_lock.locked() and not self._lock.locked():
+            raise OSError('No space left on device')
+        return RegisterStore._record_size(record)
+
+
+def assert_registers(store, correct_registers):
+    """Raises AssertionError if the store doesn't hold exactly correct_registers."""
+    stored_registers = {name: store.get(name) for name in store.names()}
+    assert stored_registers == correct_registers, (
+        "Expected {!r}, received {!r}".format(correct_registers, stored_registers))
+
+
+def test_set_and_get():
+    """Registers: set and get"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = RegisterStore(os.path.join(directory, 'registers'))
+        assert store.get('a') is None
+        store.set('a', 'line 1\n')
+        store.set('b', 'ünïcode\n')
+        store.set('a', 'line 2\n')
+        assert_registers(store, {'a': 'line 2\n', 'b': 'ünïcode\n'})
+        for name in ('', 'a\nb'):
+            try:
+                store.set(name, 'text')
+            except ValueError:
+                pass
+            else:
+                raise AssertionError('Invalid name {!r} was accepted'.format(name))
+
+
+def test_reload():
+    """Registers: reload the index from the file"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'registers')
+        store = RegisterStore(path)
+        store.set('a', 'line 1\n')
+        store.set('b b', 'line 2\n')
+        store.set('a', 'line 3\n')
+        assert_registers(RegisterStore(path), {'a': 'line 3\n', 'b b': 'line 2\n'})
+
+
+def test_truncate_incomplete_record():
+    """Registers: truncate an incomplete record at the end of the file"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'registers')
+        RegisterStore(path).set('a', 'line 1\n')
+        complete_size = os.path.getsize(path)
+        for incomplete_record in (b'100 b\nshort', b'7 b', b'x\n'):
+            with open(path, 'ab') as register_file:
+                register_file.write(incomplete_record)
+            store = RegisterStore(path)
+            assert_registers(store, {'a': 'line 1\n'})
+            assert os.path.getsize(path) == complete_size
+        # New records go after the truncated ones.
+        store.set('b', 'line 2\n')
+        assert_registers(RegisterStore(path), {'a': 'line 1\n', 'b': 'line 2\n'})
+
+
+def test_compact():
+    """Registers: compact drops stale records and keeps offsets correct"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'registers')
+        store = RegisterStore(path)
+        for number in range(10):
+            store.set('a', 'old {}\n'.format(number))
+        store.set('b', 'line 2\n')
+        store.set('a', 'line 1\n')
+        store.compact()
+        assert os.path.getsize(path) == len(b'7 b\nline 2\n7 a\nline 1\n')
+        assert_registers(store, {'a': 'line 1\n', 'b': 'line 2\n'})
+        # Records appended after compacting use the new offsets.
+        store.set('c', 'line 3\n')
+        assert_registers(store, {'a': 'line 1\n', 'b': 'line 2\n', 'c': 'line 3\n'})
+        assert_registers(RegisterStore(path),
+                         {'a': 'line 1\n', 'b': 'line 2\n', 'c': 'line 3\n'})
+
+
+def test_set_during_compact():
+    """Registers: set while compacting"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'registers')
+        store = StoreSettingDuringCompact(path)
+        store.set('a', 'old\n')
+        store.set('b', 'line 2\n')
+        store.set('b', 'line 2 again\n')
+        store.pending_set = ('a', 'new\n')
+        store.compact()
+        assert store.pending_set is None
+        correct_registers = {'a': 'new\n', 'b': 'line 2 again\n'}
+        assert_registers(store, correct_registers)
+        assert_registers(RegisterStore(path), correct_registers)
+        # The old record for a was copied before it went stale.
+        assert store._live_size < store._file_size
+        store.set('c', 'line 3\n')
+        correct_registers['c'] = 'line 3\n'
+        assert_registers(RegisterStore(path), correct_registers)
+
+
+def test_compact_scheduled():
+    """Registers: compaction is scheduled once the file is mostly stale"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'registers')
+        scheduled = []
+        store = RegisterStore(path, scheduled.append)
+        text = 'x' * (registers.COMPACT_MIN_SIZE // 4) + '\n'
+        for _ in range(3):
+            store.set('a', text)
+        assert scheduled == []
+        for _ in range(3):
+            store.set('a', text)
+        # Only scheduled once, however many more records go stale.
+        assert len(scheduled) == 1
+        scheduled[0]()
+        assert os.path.getsize(path) < registers.COMPACT_MIN_SIZE
+        assert_registers(RegisterStore(path), {'a': text})
+
+
+def test_compact_error():
+    """Registers: a failed compaction cleans up and can be scheduled again"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'registers')
+        store = StoreFailingToCompact(path)
+        store.set('a', 'old\n')
+        store.set('a', 'line 1\n')
+        store._compact_scheduled = True
+        try:
+            store.compact()
+        except OSError:
+            pass
+        else:
+            raise AssertionError('The error was not raised')
+        assert not store._compact_scheduled
+        assert not os.path.exists(path + '.tmp')
+        assert_registers(store, {'a': 'line 1\n'})
+        assert_registers(RegisterStore(path), {'a': 'line 1\n'})
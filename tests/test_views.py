@@ -0,0 +1,187 @@
+"""Tests for the commands that work across several views.
+
+Each test opens scratch views in the active window, and closes them again when
+it's done.
+"""
+
+import sublime
+from .. import main
+
+
+def new_scratch_view(text, selection):
+    """Returns a new scratch view containing text, with selection selected."""
+    view = sublime.active_window().new_file()
+    view.set_scratch(True)
+    view.run_command('append', {'characters': text})
+    view.sel().clear()
+    view.sel().add_all(selection)
+    return view
+
+
+def close_views(views):
+    """Closes the scratch views."""
+    for view in views:
+        if hasattr(view, 'close'):
+            view.close()
+        else:
+            # Sublime Text 3 can only close the active view.
+            window = view.window()
+            window.focus_view(view)
+            window.run_command('close_file')
+
+
+def assert_view(view, correct_text, correct_selection):
+    """Raises AssertionError if the view's text or selection is incorrect."""
+    text = view.substr(sublime.Region(0, view.size()))
+    assert text == correct_text, "Expected text {!r}, received {!r}".format(
+        correct_text, text)
+    selection = list(view.sel())
+    assert selection == correct_selection, (
+        "Expected selection {!r}, received {!r}".format(correct_selection, selection))
+
+
+def test_send_lines():
+    """Send lines to view"""
+    sublime.set_clipboard('CLIPBOARD')
+    view = new_scratch_view('line 1\nline 2\nline 3', [sublime.Region(8)])
+    target_view = new_scratch_view('a\nb', [sublime.Region(0)])
+    try:
+        view.run_command('ccpl_send_lines_to_view', {'view_id': target_view.id()})
+        assert_view(view, 'line 1\nline 2\nline 3', [sublime.Region(8)])
+        # A cursor has the lines inserted below it.
+        assert_view(target_view, 'a\nline 2\nb', [sublime.Region(0)])
+        assert sublime.get_clipboard() == 'CLIPBOARD'
+    finally:
+        close_views([view, target_view])
+
+
+def test_send_lines_cut():
+    """Send lines to view with cut"""
+    sublime.set_clipboard('CLIPBOARD')
+    view = new_scratch_view('line 1\nline 2\nline 3', [sublime.Region(8)])
+    target_view = new_scratch_view('a\nb\nc', [sublime.Region(2, 3)])
+    try:
+        view.run_command('ccpl_send_lines_to_view',
+                         {'view_id': target_view.id(), 'cut': True})
+        assert_view(view, 'line 1\nline 3', [sublime.Region(8)])
+        # A selection has its line overwritten.
+        assert_view(target_view, 'a\nline 2\nc', [sublime.Region(3)])
+        assert sublime.get_clipboard() == 'CLIPBOARD'
+    finally:
+        close_views([view, target_view])
+
+
+def test_send_lines_reindent():
+    """Send lines to view with reindent"""
+    view = new_scratch_view('a\n  line 1\n', [sublime.Region(3)])
+    target_view = new_scratch_view('\tb\nc', [sublime.Region(1)])
+    try:
+        view.run_command('ccpl_send_lines_to_view',
+                         {'view_id': target_view.id(), 'reindent': True})
+        assert_view(target_view, '\tb\n\tline 1\nc', [sublime.Region(1)])
+    finally:
+        close_views([view, target_view])
+
+
+def test_send_lines_to_same_view():
+    """Send lines to the same view does nothing"""
+    view = new_scratch_view('line 1\nline 2', [sublime.Region(1)])
+    try:
+        view.run_command('ccpl_send_lines_to_view',
+                         {'view_id': view.id(), 'cut': True})
+        assert_view(view, 'line 1\nline 2', [sublime.Region(1)])
+        assert main._lines_in_transit is None
+    finally:
+        close_views([view])
+
+
+class SelectedTabsWindow:
+    """Stands in for a window with the tabs of views selected."""
+
+    class Sheet:
+        def __init__(self, view):
+            self._view = view
+
+        def view(self):
+            return self._view
+
+    def __init__(self, views):
+        self.views = views
+
+    def selected_sheets(self):
+        return [self.Sheet(view) for view in self.views]
+
+
+def paste_to_views(views, reindent=False):
+    """Runs ccpl_paste_to_selected_views with the tabs of views selected."""
+    command = main.CcplPasteToSelectedViewsCommand(SelectedTabsWindow(views))
+    command.run(reindent=reindent)
+
+
+def test_paste_to_selected_views():
+    """Paste to selected views"""
+    sublime.set_clipboard('new line\n')
+    view = new_scratch_view('a\nb', [sublime.Region(0)])
+    other_view = new_scratch_view('c\nd\ne', [sublime.Region(2, 3)])
+    try:
+        paste_to_views([view, other_view])
+        assert_view(view, 'a\nnew line\nb', [sublime.Region(0)])
+        assert_view(other_view, 'c\nnew line\ne', [sublime.Region(3)])
+        assert main._lines_in_transit is None
+    finally:
+        close_views([view, other_view])
+
+
+def test_paste_to_selected_views_once_per_buffer():
+    """Paste to selected views of the same file pastes once"""
+    sublime.set_clipboard('new line\n')
+    view = new_scratch_view('a\nb', [sublime.Region(0)])
+    try:
+        paste_to_views([view, view])
+        assert_view(view, 'a\nnew line\nb', [sublime.Region(0)])
+    finally:
+        close_views([view])
+
+
+def test_paste_to_selected_views_text():
+    """Paste to selected views does a regular paste of text within a line"""
+    sublime.set_clipboard('word')
+    view = new_scratch_view('a\nb', [sublime.Region(0)])
+    other_view = new_scratch_view('c', [sublime.Region(1)])
+    try:
+        paste_to_views([view, other_view])
+        assert_view(view, 'worda\nb', [sublime.Region(4)])
+        assert_view(other_view, 'cword', [sublime.Region(5)])
+    finally:
+        close_views([view, other_view])
+
+
+def test_reindented_once_per_indentation():
+    """Reindented text is built once for each indentation"""
+    reindent_lines = main.reindent_lines
+    indentations = []
+    def counting_reindent_lines(lines, old_indentation, new_indentation):
+        indentations.append(new_indentation)
+        return reindent_lines(lines, old_indentation, new_indentation)
+    main.reindent_lines = counting_reindent_lines
+    try:
+        paste_text = main.PasteText('  a\n    b\n')
+        assert paste_text.reindented('\t') == '\ta\n\t  b\n'
+        assert paste_text.reindented('') == 'a\n  b\n'
+        assert paste_text.reindented('\t') == '\ta\n\t  b\n'
+        # The text's own indentation needs no building at all.
+        assert paste_text.reindented('  ') == '  a\n    b\n'
+        assert indentations == ['\t', ''], indentations
+        # Across views, the clipboard is only reindented once per indentation.
+        del indentations[:]
+        sublime.set_clipboard('  a\n')
+        views = [new_scratch_view('\tb\n\tc', [sublime.Region(1), sublime.Region(4)]),
+                 new_scratch_view('\td', [sublime.Region(1)])]
+        try:
+            paste_to_views(views, reindent=True)
+            assert_view(views[1], '\td\n\ta', [sublime.Region(1)])
+            assert indentations == ['\t'], indentations
+        finally:
+            close_views(views)
+    finally:
+        main.reindent_lines = reindent_lines